@@ -0,0 +1,133 @@
+"""Synthetic Python and C programs of controllable size and shape.
+
+Usage: python benchmarks/corpus.py LANG OUTPUT [--functions N] [--depth N]
+[--calls N] [--elifs N] [--statements N]
+
+Every function has a few plain statements with ``calls`` calls each, an
+if/elif/else chain with ``elifs`` elif branches and loops nested ``depth``
+levels deep, alternating for and while. The same knobs produce the same
+program, so results of different runs are comparable. The suite in
+benchmarks/suite.py imports generate() from here.
+"""
+import argparse
+
+LANGS = ("python", "c")
+
+
+def _calls(calls: int, arg: str) -> str:
+    if not calls:
+        return arg
+    return " + ".join("helper(%s, %d)" % (arg, i) for i in range(calls))
+
+
+def _python_body(lines, level, depth, calls, elifs, statements):
+    indent = "    " * (level + 1)
+    for i in range(statements):
+        lines.append("%sx%d_%d = %s" % (indent, level, i, _calls(calls, "n")))
+    lines.append("%sif n == 0:" % indent)
+    lines.append("%s    total += %s" % (indent, _calls(calls, "0")))
+    for i in range(1, elifs + 1):
+        lines.append("%selif n == %d:" % (indent, i))
+        lines.append("%s    total -= %d" % (indent, i))
+    lines.append("%selse:" % indent)
+    lines.append("%s    total = helper(total, n)" % indent)
+    if level < depth:
+        if level % 2:
+            lines.append("%swhile n > %d:" % (indent, level))
+            lines.append("%s    n -= 1" % indent)
+        else:
+            lines.append("%sfor i%d in range(n):" % (indent, level))
+        _python_body(lines, level + 1, depth, calls, elifs, statements)
+
+
+def _c_body(lines, level, depth, calls, elifs, statements):
+    indent = "    " * (level + 1)
+    for i in range(statements):
+        lines.append("%sint x%d_%d = %s;" % (indent, level, i, _calls(calls, "n")))
+    lines.append("%sif (n == 0) {" % indent)
+    lines.append("%s    total += %s;" % (indent, _calls(calls, "0")))
+    for i in range(1, elifs + 1):
+        lines.append("%s} else if (n == %d) {" % (indent, i))
+        lines.append("%s    total -= %d;" % (indent, i))
+    lines.append("%s} else {" % indent)
+    lines.append("%s    total = helper(total, n);" % indent)
+    lines.append("%s}" % indent)
+    if level < depth:
+        if level % 2:
+            lines.append("%swhile (n > %d) {" % (indent, level))
+            lines.append("%s    n--;" % indent)
+        else:
+            lines.append("%sfor (int i%d = 0; i%d < n; i%d++) {" % (indent, level, level, level))
+        _c_body(lines, level + 1, depth, calls, elifs, statements)
+        lines.append("%s}" % indent)
+
+
+def generate(
+    lang: str,
+    functions: int = 100,
+    depth: int = 3,
+    calls: int = 2,
+    elifs: int = 3,
+    statements: int = 3,
+) -> bytes:
+    """Source of a program with ``functions`` functions and a main part calling them."""
+    lines = []
+    if lang == "python":
+        lines += ["def helper(a, b):", "    return a + b", ""]
+        for f in range(functions):
+            lines.append("def f%d(n):" % f)
+            lines.append("    total = 0")
+            _python_body(lines, 0, depth, calls, elifs, statements)
+            lines.append("    return total")
+            lines.append("")
+        lines.extend("print(f%d(%d))" % (f, f) for f in range(functions))
+    elif lang == "c":
+        lines += ["int helper(int a, int b) {", "    return a + b;", "}", ""]
+        for f in range(functions):
+            lines.append("int f%d(int n) {" % f)
+            lines.append("    int total = 0;")
+            _c_body(lines, 0, depth, calls, elifs, statements)
+            lines.append("    return total;")
+            lines.append("}")
+            lines.append("")
+        lines.append("int main() {")
+        lines.extend("    f%d(%d);" % (f, f) for f in range(functions))
+        lines.append("    return 0;")
+        lines.append("}")
+    else:
+        raise ValueError("Unsupported programming language: %s" % lang)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def add_arguments(argument_parser):
+    argument_parser.add_argument("--functions", type=int, default=100)
+    argument_parser.add_argument("--depth", type=int, default=3, help="Loop nesting depth")
+    argument_parser.add_argument("--calls", type=int, default=2, help="Calls per statement")
+    argument_parser.add_argument("--elifs", type=int, default=3, help="Length of elif chains")
+    argument_parser.add_argument(
+        "--statements", type=int, default=3, help="Plain statements per block"
+    )
+
+
+def shape(args) -> dict:
+    return {
+        "functions": args.functions,
+        "depth": args.depth,
+        "calls": args.calls,
+        "elifs": args.elifs,
+        "statements": args.statements,
+    }
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argument_parser.add_argument("lang", choices=LANGS)
+    argument_parser.add_argument("output", help="Path of the generated source file")
+    add_arguments(argument_parser)
+    args = argument_parser.parse_args()
+    with open(args.output, "wb") as fobj:
+        fobj.write(generate(args.lang, **shape(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Expression scanning cost on large and deeply nested expressions.
+
+Usage: python benchmarks/expressions.py [--size N]
+
+Times StatementParser over single statements that stress the function
+call search: long boolean conditions, big literal tables, calls with many
+arguments and deeply nested calls, for both the Python and C frontends.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code2json.python import Python2JSONParser  # noqa: E402
+from code2json.c import C2JSONParser  # noqa: E402
+
+
+def python_cases(size):
+    depth = min(size // 10, 200)
+    header = "def f(*args):\n    return 0\n\n"
+    return {
+        "bool chain": header + "x = " + " and ".join(f"f(a{i})" for i in range(size)),
+        "literal table": header + "x = [" + ", ".join(str(i) for i in range(size * 4)) + "]",
+        "many arguments": header + "f(" + ", ".join(f"a{i} + {i}" for i in range(size)) + ")",
+        "nested calls": header + "x = " + "f(" * depth + "1" + ")" * depth,
+    }
+
+
+def c_cases(size):
+    depth = min(size // 10, 200)
+    header = "int f(int x, ...) { return 0; }\n"
+    return {
+        "bool chain": header + "int x = " + " && ".join(f"f(a{i})" for i in range(size)) + ";",
+        "literal table": header + "int x[] = {" + ", ".join(str(i) for i in range(size * 4)) + "};",
+        "many arguments": header + "int y = f(" + ", ".join(f"a{i} + {i}" for i in range(size)) + ");",
+        "nested calls": header + "int x = " + "f(" * depth + "1" + ")" * depth + ";",
+    }
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argument_parser.add_argument("--size", type=int, default=2000)
+    args = argument_parser.parse_args()
+
+    print("%-8s %-16s %12s" % ("lang", "case", "ms"))
+    for lang, parser_class, cases in (
+        ("python", Python2JSONParser, python_cases(args.size)),
+        ("c", C2JSONParser, c_cases(args.size)),
+    ):
+        for name, code in cases.items():
+            code = code.encode()
+            best = min(timeit.repeat(lambda: parser_class(code).parse_all(), number=1, repeat=3))
+            print("%-8s %-16s %12.2f" % (lang, name, best * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Call resolution cost as the number of functions in a module grows.
+
+Usage: python benchmarks/find_function.py [--calls N]
+
+Builds Python modules with an increasing number of functions that each
+make N calls to other functions of the module, and times parse_all() on
+them twice: with a linear search over the definitions for every call, as
+before the name index, and with the index. With the index the time per
+call stays flat instead of growing with the module.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code2json.python import Python2JSONParser  # noqa: E402
+
+FUNCTION_COUNTS = (10, 100, 1000, 2000)
+
+
+class LinearSearchParser(Python2JSONParser):
+    """Resolves every call by scanning the definitions in order."""
+
+    def find_function_id(self, name):
+        for definition, func_id in self._definitions:
+            if name in self.qualified_names(definition):
+                return func_id
+        return None
+
+
+def make_module(functions: int, calls: int) -> bytes:
+    lines = []
+    for i in range(functions):
+        body = "".join(
+            f"    bench.func_{(i * 7919 + j) % functions}(x)\n" if j % 2 else
+            f"    func_{(i * 7919 + j) % functions}(x)\n"
+            for j in range(calls)
+        )
+        lines.append(f"def func_{i}(x):\n{body}    missing(x)\n")
+    return "\n".join(lines).encode()
+
+
+def time_parse(parser_class, code: bytes) -> float:
+    def parse():
+        parser_class(code, module="bench").parse_all()
+
+    return min(timeit.repeat(parse, number=1, repeat=3))
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argument_parser.add_argument("--calls", type=int, default=10, help="Calls per function")
+    args = argument_parser.parse_args()
+
+    print("%10s %16s %16s" % ("functions", "linear us/call", "index us/call"))
+    for count in FUNCTION_COUNTS:
+        code = make_module(count, args.calls)
+        total_calls = count * (args.calls + 1)
+        linear = time_parse(LinearSearchParser, code)
+        indexed = time_parse(Python2JSONParser, code)
+        print(
+            "%10d %16.3f %16.3f"
+            % (count, linear / total_calls * 1e6, indexed / total_calls * 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
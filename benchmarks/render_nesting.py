@@ -0,0 +1,47 @@
+"""Render time of deeply nested functions relative to the HTML size.
+
+Usage: python benchmarks/render_nesting.py [--statements N]
+
+Builds C functions of nested loops with a few statements on each
+level and renders them with JSON2HtmlBuilder. When rendering is linear in
+the output size the time per kilobyte of HTML stays flat as the nesting
+grows.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code2json.c import C2JSONParser  # noqa: E402
+from json2html.builder import JSON2HtmlBuilder  # noqa: E402
+
+DEPTHS = (10, 25, 50, 100)
+
+
+def make_function(depth: int, statements: int) -> bytes:
+    lines = ["int nested(int n) {"]
+    for level in range(depth):
+        lines.extend(f"int x{level}_{i} = {i};" for i in range(statements))
+        lines.append(f"for (int i{level} = 0; i{level} < n; i{level}++) {{")
+    lines.append("}" * (depth + 1))
+    return "\n".join(lines).encode()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    argument_parser.add_argument("--statements", type=int, default=20)
+    args = argument_parser.parse_args()
+
+    builder = JSON2HtmlBuilder("c")
+    print("%8s %12s %10s %14s" % ("depth", "HTML bytes", "ms", "us per KiB"))
+    for depth in DEPTHS:
+        tree = C2JSONParser(make_function(depth, args.statements)).parse_all()
+        size = len(builder.build(tree))
+        best = min(timeit.repeat(lambda: builder.build(tree), number=1, repeat=5))
+        print("%8d %12d %10.2f %14.2f" % (depth, size, best * 1e3, best * 1e6 / (size / 1024)))
+
+
+if __name__ == "__main__":
+    main()
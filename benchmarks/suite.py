@@ -0,0 +1,126 @@
+"""Parse, render and serialization throughput on a synthetic corpus.
+
+Usage: python benchmarks/suite.py [--functions N] [--depth N] [--calls N]
+[--elifs N] [--statements N] [--repeat N] [--lang LANG] [-o PATH]
+
+Generates one Python and one C program with benchmarks/corpus.py and
+times, for each, parse_all(), JSON2HtmlBuilder.build() and json.dumps() /
+json.loads() of the tree separately. Every phase reports the best of
+``--repeat`` runs, lines and tree nodes per second, and the peak of Python
+allocations measured with tracemalloc in one extra run (memory allocated
+by tree-sitter itself is not included). The result is a JSON document, so
+runs of different releases can be compared by a script.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import LANGS, add_arguments, generate, shape  # noqa: E402
+from code2json.c import C2JSONParser  # noqa: E402
+from code2json.python import Python2JSONParser  # noqa: E402
+from json2html.builder import JSON2HtmlBuilder  # noqa: E402
+
+PARSERS = {"python": Python2JSONParser, "c": C2JSONParser}
+
+
+def count_nodes(tree: dict) -> int:
+    count = 0
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            count += 1
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return count
+
+
+def measure(func, repeat: int):
+    """Best time of ``repeat`` runs and the tracemalloc peak of one more."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(lang: str, params: dict, repeat: int) -> list:
+    code = generate(lang, **params)
+    lines = code.count(b"\n")
+    parser_class = PARSERS[lang]
+    tree = parser_class(code).parse_all()
+    nodes = count_nodes(tree)
+    text = json.dumps(tree, ensure_ascii=False)
+    builder = JSON2HtmlBuilder(lang)
+    builder.preload()
+    phases = {
+        "parse": lambda: parser_class(code).parse_all(),
+        "render": lambda: builder.build(tree),
+        "json_dump": lambda: json.dumps(tree, ensure_ascii=False),
+        "json_load": lambda: json.loads(text),
+    }
+    results = []
+    for phase, func in phases.items():
+        seconds, peak = measure(func, repeat)
+        results.append(
+            {
+                "lang": lang,
+                "phase": phase,
+                "seconds": seconds,
+                "lines": lines,
+                "nodes": nodes,
+                "lines_per_s": lines / seconds,
+                "nodes_per_s": nodes / seconds,
+                "peak_bytes": peak,
+            }
+        )
+    return results
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(argument_parser)
+    argument_parser.add_argument("--repeat", type=int, default=3)
+    argument_parser.add_argument(
+        "--lang", action="append", choices=LANGS, help="Benchmark only this language"
+    )
+    argument_parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = argument_parser.parse_args()
+
+    params = shape(args)
+    results = []
+    for lang in args.lang or LANGS:
+        results.extend(run(lang, params, args.repeat))
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as fobj:
+            fobj.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
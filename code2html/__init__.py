@@ -0,0 +1,71 @@
+"""In-process conversion of source code to HTML.
+
+convert() feeds the tree from the code2json parser straight into
+JSON2HtmlBuilder, without the two interpreter startups and the JSON
+round trip of the command line tools. The tree-sitter parser and the
+builder (with its Jinja environment and loaded templates) are created
+once per language and reused by every call, so a long-running service
+can render on request.
+"""
+import threading
+from typing import Dict, Iterator, Optional
+
+from code2json.c import C2JSONParser
+from code2json.python import Python2JSONParser
+from json2html.builder import JSON2HtmlBuilder
+from json2html.cache import FragmentCache
+
+LANGUAGES = {"python": Python2JSONParser, "c": C2JSONParser}
+
+_lock = threading.Lock()
+_builders: Dict[str, JSON2HtmlBuilder] = {}
+_fragment_cache: Optional[FragmentCache] = None
+
+
+def use_fragment_cache(cache: Optional[FragmentCache]):
+    """Share a fragment cache between all builders (None turns it off)."""
+    global _fragment_cache
+    with _lock:
+        _fragment_cache = cache
+        for builder in _builders.values():
+            builder.fragment_cache = cache
+
+
+def get_builder(lang: str) -> JSON2HtmlBuilder:
+    """Return the shared builder of a language, creating it on first use."""
+    builder = _builders.get(lang)
+    if builder is None:
+        with _lock:
+            builder = _builders.get(lang)
+            if builder is None:
+                builder = _builders[lang] = JSON2HtmlBuilder(
+                    lang, fragment_cache=_fragment_cache
+                )
+    return builder
+
+
+def parse(source: bytes, lang: str, module: Optional[str] = None) -> dict:
+    """Parse source code into the algorithm tree."""
+    if lang not in LANGUAGES:
+        raise ValueError("Unsupported programming language: %s" % lang)
+    return LANGUAGES[lang](source, module=module).parse_all()
+
+
+def convert(
+    source: bytes, lang: str, with_buttons: bool = True, module: Optional[str] = None
+) -> str:
+    """Convert source code to the HTML document.
+
+    ``module`` is the module name of Python code, so that calls like
+    ``module.func()`` resolve to functions of the same source.
+    """
+    tree = parse(source, lang, module)
+    return get_builder(lang).build(tree, with_buttons=with_buttons)
+
+
+def stream(
+    source: bytes, lang: str, with_buttons: bool = True, module: Optional[str] = None
+) -> Iterator[str]:
+    """Like convert(), but yield the document in chunks as it is rendered."""
+    tree = parse(source, lang, module)
+    return get_builder(lang).iter_build(tree, with_buttons=with_buttons)
@@ -0,0 +1,187 @@
+"""asyncio entry points for parsing and rendering.
+
+AsyncConverter runs the CPU-bound work in an executor, so an event loop is
+never blocked by a large input. At most ``max_concurrency`` calls occupy
+the executor at a time; the others wait on a semaphore in the order they
+came. A streamed document takes its slot one chunk at a time, so a big
+document being streamed does not hold off the small requests that come
+after it.
+
+Several threads parse at once, so every thread of the default pool
+parses with a tree-sitter parser of its own (code2json.grammars hands one
+out per thread); the threads take theirs when they start.
+
+Cancelling a call stops the work at the next top-level function or
+statement (with the default thread pool) and frees its slot once the
+worker has stopped. A ProcessPoolExecutor may be passed instead; the work
+then cannot be interrupted once started, and stream() renders the whole
+document in a worker and yields it as one chunk.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from . import LANGUAGES, get_builder
+from code2json.grammars import get_parser
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _init_thread():
+    for lang in LANGUAGES:
+        get_parser(lang)
+
+
+def _check(cancelled: Optional[threading.Event]):
+    if cancelled is not None and cancelled.is_set():
+        raise _Cancelled()
+
+
+def _parse(source: bytes, lang: str, module: Optional[str], cancelled=None) -> dict:
+    if lang not in LANGUAGES:
+        raise ValueError("Unsupported programming language: %s" % lang)
+    parser = LANGUAGES[lang](source, module=module)
+    functions = []
+    global_code = []
+    for result in parser.iter_parse():
+        _check(cancelled)
+        (functions if result["type"] == "func" else global_code).append(result)
+    return parser.document(functions, global_code)
+
+
+def _render(tree, lang: str, with_buttons: bool, cancelled=None) -> str:
+    chunks = []
+    for chunk in get_builder(lang).iter_build(tree, with_buttons=with_buttons):
+        _check(cancelled)
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+def _convert(source: bytes, lang: str, module: Optional[str], with_buttons: bool, cancelled=None) -> str:
+    return _render(_parse(source, lang, module, cancelled), lang, with_buttons, cancelled)
+
+
+def _open_stream(source: bytes, lang: str, module: Optional[str], with_buttons: bool, cancelled=None):
+    tree = _parse(source, lang, module, cancelled)
+    return _Chunks(get_builder(lang).iter_build(tree, with_buttons=with_buttons))
+
+
+class _Chunks:
+    """A chunk generator that one worker at a time may advance or close."""
+
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def next(self, cancelled=None):
+        with self._lock:
+            chunk = _END if self._closed else next(self._iterator, _END)
+            if self._closed:
+                self._iterator.close()
+            return chunk
+
+    def close(self):
+        """Close the generator now, or after the worker that is advancing it."""
+        # a cancelled stream may leave a worker inside the generator; that
+        # worker closes it when it is done instead of this waiting for it
+        self._closed = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._iterator.close()
+            finally:
+                self._lock.release()
+
+
+class AsyncConverter:
+    def __init__(self, executor: Optional[Executor] = None, max_concurrency: Optional[int] = None):
+        """``executor`` defaults to a thread pool of ``max_concurrency`` threads
+        (by default as many as ThreadPoolExecutor picks).
+
+        ``max_concurrency`` is required with an ``executor`` of the caller;
+        it is usually the executor's number of workers.
+        """
+        self._own_executor = executor is None
+        if executor is None:
+            # the default of ThreadPoolExecutor
+            max_concurrency = max_concurrency or min(32, (os.cpu_count() or 1) + 4)
+            executor = ThreadPoolExecutor(
+                max_workers=max_concurrency,
+                thread_name_prefix="code2html",
+                initializer=_init_thread,
+            )
+        elif max_concurrency is None:
+            raise TypeError("max_concurrency is required with a custom executor")
+        self._executor = executor
+        self._threads = not isinstance(executor, ProcessPoolExecutor)
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # a process pool cannot share an event, its work runs to the end
+        cancelled = threading.Event() if self._threads else None
+        await self._slots.acquire()
+        try:
+            future = self._executor.submit(func, *args, cancelled)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        def release(_):
+            # the slot is taken until the worker is done, even after a cancel
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._slots.release)
+
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.set()
+            raise
+
+    async def parse(self, source: bytes, lang: str, module: Optional[str] = None) -> dict:
+        """Parse source code into the algorithm tree."""
+        return await self._run(_parse, source, lang, module)
+
+    async def render(self, tree, lang: str, with_buttons: bool = True) -> str:
+        """Render a tree (dict, NodeTable, JSON or compact bytes) to HTML."""
+        return await self._run(_render, tree, lang, with_buttons)
+
+    async def convert(
+        self, source: bytes, lang: str, with_buttons: bool = True, module: Optional[str] = None
+    ) -> str:
+        """Convert source code to the HTML document."""
+        return await self._run(_convert, source, lang, module, with_buttons)
+
+    async def stream(
+        self, source: bytes, lang: str, with_buttons: bool = True, module: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Like convert(), but yield the document in chunks as it is rendered."""
+        if not self._threads:
+            yield await self.convert(source, lang, with_buttons, module)
+            return
+        chunks = await self._run(_open_stream, source, lang, module, with_buttons)
+        try:
+            while (chunk := await self._run(chunks.next)) is not _END:
+                yield chunk
+        finally:
+            chunks.close()
+
+    def close(self):
+        """Shut down the executor if it was created here."""
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
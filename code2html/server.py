@@ -0,0 +1,289 @@
+"""Local conversion server with warm parsers and builders.
+
+Usage: python -m code2html.server [--port N | --unix PATH] [-j N] [--queue N]
+
+Requests are plain HTTP on localhost or on a Unix socket:
+
+    POST /parse?lang=LANG[&module=NAME]    source code -> JSON tree
+    POST /render?lang=LANG[&buttons=0]     JSON, compact or table tree -> HTML
+    POST /convert?lang=LANG[&module=NAME][&buttons=0]
+                                           source code -> HTML
+    GET  /stats                            request counters as JSON
+
+The work runs in a pool of worker processes. Every worker loads the
+grammars and creates one builder per language with all templates compiled
+when it starts, so a request only pays for the conversion itself. At most
+``queue`` requests are accepted at a time (running or waiting for a
+worker); requests beyond that are answered with 503 and a Retry-After
+header at once, before their body is read, instead of piling up.
+"""
+import argparse
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from . import LANGUAGES, get_builder, parse, use_fragment_cache
+from code2json.grammars import get_parser
+from json2html.cache import FragmentCache
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BODY = 64 << 20
+
+
+def _init_worker(fragment_cache_dir):
+    if fragment_cache_dir:
+        use_fragment_cache(FragmentCache(directory=fragment_cache_dir))
+    for lang in LANGUAGES:
+        get_parser(lang)
+        get_builder(lang).preload()
+
+
+def _parse(source: bytes, lang: str, module: Optional[str]) -> bytes:
+    tree = parse(source, lang, module)
+    return json.dumps(tree, ensure_ascii=False).encode("utf-8")
+
+
+def _render(data: bytes, lang: str, with_buttons: bool) -> bytes:
+    return get_builder(lang).build(data, with_buttons=with_buttons).encode("utf-8")
+
+
+def _convert(source: bytes, lang: str, module: Optional[str], with_buttons: bool) -> bytes:
+    tree = parse(source, lang, module)
+    return get_builder(lang).build(tree, with_buttons=with_buttons).encode("utf-8")
+
+
+class ConversionService:
+    """Worker pool with a bound on the requests it holds at a time."""
+
+    def __init__(self, jobs: Optional[int] = None, queue: Optional[int] = None, fragment_cache_dir=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.queue = queue or self.jobs * 4
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=_init_worker, initargs=(fragment_cache_dir,)
+        )
+        self._slots = threading.BoundedSemaphore(self.queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def warm_up(self):
+        """Start all workers now instead of on the first requests."""
+        futures = [self._executor.submit(os.getpid) for _ in range(self.jobs)]
+        for future in futures:
+            future.result()
+
+    def reserve(self) -> bool:
+        """Take a queue slot for one run(), False if the queue is full."""
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def release(self):
+        """Give back the slot of a reserve() that is not followed by run()."""
+        self._slots.release()
+
+    def run(self, func, *args):
+        """Result of func(*args) in a worker; takes the slot of a reserve()."""
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+        try:
+            return self._executor.submit(func, *args).result()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.jobs,
+                "queue": self.queue,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "errors": self.errors,
+            }
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    max_body = DEFAULT_MAX_BODY
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers=()):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self._send(status, body, "application/json", headers)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/stats":
+            return self._error(404, "Not found")
+        body = json.dumps(self.server.service.stats()).encode("utf-8")
+        self._send(200, body, "application/json")
+
+    def do_POST(self):
+        # every answer before the body is read closes the connection, the
+        # unread body would be taken for the next request otherwise
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        lang = query.get("lang", "").lower()
+        module = query.get("module")
+        with_buttons = query.get("buttons", "1") not in ("0", "false", "no")
+        if url.path == "/parse":
+            task, args, content_type = _parse, (lang, module), "application/json"
+        elif url.path == "/render":
+            task, args, content_type = _render, (lang, with_buttons), "text/html"
+        elif url.path == "/convert":
+            task, args, content_type = _convert, (lang, module, with_buttons), "text/html"
+        else:
+            self.close_connection = True
+            return self._error(404, "Not found")
+        if lang not in LANGUAGES:
+            self.close_connection = True
+            return self._error(400, "Unsupported programming language: %s" % lang)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._error(400, "Invalid Content-Length")
+        if length > self.max_body:
+            self.close_connection = True
+            return self._error(413, "Request body is too large")
+
+        service = self.server.service
+        if not service.reserve():
+            self.close_connection = True
+            return self._error(503, "Too many requests", [("Retry-After", "1")])
+        try:
+            data = self.rfile.read(length)
+        except BaseException:
+            service.release()
+            raise
+        try:
+            result = service.run(task, data, *args)
+        except Exception as e:
+            return self._error(422, "%s: %s" % (type(e).__name__, e))
+        self._send(200, result, content_type + "; charset=utf-8")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+def _socket_id(path: str) -> Optional[tuple]:
+    """(device, inode) of a Unix socket file, None if there is no file."""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(info.st_mode):
+        raise FileExistsError("%s exists and is not a socket" % path)
+    return info.st_dev, info.st_ino
+
+
+def remove_socket(server):
+    """Remove the Unix socket file of a server if it is still the one it created."""
+    path = getattr(server, "unix_path", None)
+    try:
+        if path and _socket_id(path) == server.unix_id:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def make_server(service: ConversionService, host="127.0.0.1", port=DEFAULT_PORT, unix=None, quiet=False):
+    if unix:
+        # a stale socket of an earlier run is replaced, any other file is kept
+        if _socket_id(unix) is not None:
+            os.remove(unix)
+        server = UnixHTTPServer(unix, RequestHandler)
+        server.unix_path = unix
+        server.unix_id = _socket_id(unix)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+argument_parser = argparse.ArgumentParser(
+    description="Serve code to JSON and HTML conversion over local HTTP"
+)
+argument_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+argument_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (default: %d)" % DEFAULT_PORT)
+argument_parser.add_argument("--unix", help="Listen on this Unix socket instead of TCP")
+argument_parser.add_argument(
+    "-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)"
+)
+argument_parser.add_argument(
+    "--queue", type=int, default=None, help="Requests accepted at a time before answering 503 (default: 4 per worker)"
+)
+argument_parser.add_argument(
+    "--fragment-cache", help="Directory of the rendered fragment cache shared by the workers"
+)
+argument_parser.add_argument("--quiet", action="store_true", default=False, help="Do not log requests")
+
+
+def main():
+    args = argument_parser.parse_args()
+    service = ConversionService(args.jobs, args.queue, args.fragment_cache)
+    try:
+        server = make_server(service, args.host, args.port, args.unix, args.quiet)
+    except FileExistsError as e:
+        service.close()
+        argument_parser.error(str(e))
+    service.warm_up()
+    print(
+        "Listening on %s with %d workers" % (args.unix or "%s:%d" % (args.host, args.port), service.jobs),
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        remove_socket(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Source code (Python, C) to algorithm JSON tree compiler."""
@@ -0,0 +1,180 @@
+"""Batch conversion of many source files over a process pool.
+
+Every worker process loads the grammar and creates its tree-sitter parser
+once, then converts a share of the inputs. A failing file is reported and
+skipped, the rest of the batch goes on.
+"""
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from . import compact as compact_format
+from .emitter import JSONStreamWriter
+from .cache import ParseCache
+from .grammars import get_parser
+from .source import open_source
+from .table import NodeTable
+
+SOURCE_SUFFIXES = {"python": (".py",), "c": (".c", ".h")}
+OUTPUT_SUFFIXES = {"json": ".json", "compact": ".tree", "table": ".table"}
+
+_worker = {}
+
+
+def parser_options(lang: str, path: str) -> dict:
+    """Extra constructor arguments of the language parser for a source file."""
+    if lang == "python":
+        # calls like `module.func()` resolve to functions of this file
+        return {"module": os.path.splitext(os.path.basename(path))[0]}
+    return {}
+
+
+def collect_inputs(lang: str, patterns: List[str]) -> List[str]:
+    """Expand directories (recursively) and glob patterns into source files.
+
+    Raises FileNotFoundError for an input that is neither a file nor a
+    directory and matches no file as a pattern.
+    """
+    suffixes = SOURCE_SUFFIXES.get(lang, ())
+    result = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                result.extend(
+                    os.path.join(root, name)
+                    for name in sorted(files)
+                    if name.endswith(suffixes)
+                )
+        elif os.path.isfile(pattern):
+            result.append(pattern)
+        else:
+            matches = [
+                path for path in sorted(glob.glob(pattern, recursive=True))
+                if os.path.isfile(path)
+            ]
+            if not matches:
+                raise FileNotFoundError("No such file or directory: %s" % pattern)
+            result.extend(matches)
+    return result
+
+
+def _init_worker(parser_class, lang, output_dir, base_dir, compact, output_format, cache_dir):
+    get_parser(lang)
+    _worker.update(
+        parser_class=parser_class,
+        lang=lang,
+        output_dir=output_dir,
+        base_dir=base_dir,
+        compact=compact,
+        output_format=output_format,
+        cache=ParseCache(cache_dir) if cache_dir else None,
+    )
+
+
+def _output_path(path: str) -> str:
+    suffix = OUTPUT_SUFFIXES[_worker["output_format"]]
+    if not _worker["output_dir"]:
+        return os.path.splitext(path)[0] + suffix
+    relative = os.path.relpath(os.path.abspath(path), _worker["base_dir"])
+    return os.path.join(
+        _worker["output_dir"], os.path.splitext(relative)[0] + suffix
+    )
+
+
+def _convert(path: str, jsonl: bool) -> Tuple[str, Optional[str], Optional[str], bool]:
+    """Returns (path, JSON Lines record or None, error or None, cache hit)."""
+    try:
+        options = parser_options(_worker["lang"], path)
+        with open_source(path) as data:
+            parser = _worker["parser_class"](data, cache=_worker["cache"], **options)
+            if jsonl:
+                record = json.dumps(
+                    {"path": path, "tree": parser.parse_all()}, ensure_ascii=False
+                )
+                return path, record, None, parser.from_cache
+            out_path = _output_path(path)
+            os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+            if _worker["output_format"] == "compact":
+                with open(out_path, "wb") as f:
+                    f.write(compact_format.dumps(parser.parse_all()))
+                return path, None, None, parser.from_cache
+            if _worker["output_format"] == "table":
+                with open(out_path, "wb") as f:
+                    f.write(NodeTable.from_parser(parser).dumps())
+                return path, None, None, parser.from_cache
+            with open(out_path, "w", encoding="utf-8") as f:
+                JSONStreamWriter(f, compact=_worker["compact"]).write(parser)
+                f.write("\n")
+        return path, None, None, parser.from_cache
+    except Exception as e:
+        return path, None, "%s: %s" % (type(e).__name__, e), False
+
+
+def _convert_json(path):
+    return _convert(path, False)
+
+
+def _convert_jsonl(path):
+    return _convert(path, True)
+
+
+def run_batch(
+    parser_class,
+    lang: str,
+    paths: List[str],
+    jobs: Optional[int] = None,
+    output_dir: Optional[str] = None,
+    jsonl: Optional[str] = None,
+    compact: bool = False,
+    output_format: str = "json",
+    cache_dir: Optional[str] = None,
+) -> int:
+    """Converts all paths and returns the number of failed files.
+
+    Results go to one ``.json`` (``.tree`` in the compact format, ``.table``
+    for node tables) per input, next to it or mirrored under
+    ``output_dir``, or, with ``jsonl``, to a single JSON Lines file. With
+    ``cache_dir`` unchanged files are taken from the parse cache in that
+    directory.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    base_dir = ""
+    if paths:
+        base_dir = os.path.commonpath(
+            [os.path.dirname(os.path.abspath(path)) for path in paths]
+        )
+    chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+    failures = 0
+    hits = 0
+    stream = open(jsonl, "w") if jsonl else None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(
+                parser_class, lang, output_dir, base_dir, compact, output_format, cache_dir
+            ),
+        ) as executor:
+            convert = _convert_jsonl if stream else _convert_json
+            for path, record, error, cached in executor.map(convert, paths, chunksize=chunksize):
+                hits += cached
+                if error:
+                    failures += 1
+                    print("%s: %s" % (path, error), file=sys.stderr)
+                    if stream:
+                        record = json.dumps({"path": path, "error": error}, ensure_ascii=False)
+                        stream.write(record + "\n")
+                elif stream:
+                    stream.write(record + "\n")
+    finally:
+        if stream:
+            stream.close()
+    summary = "%d files converted, %d failed" % (len(paths) - failures, failures)
+    if cache_dir:
+        summary += ", %d cache hits, %d misses" % (hits, len(paths) - failures - hits)
+    print(summary, file=sys.stderr)
+    return failures
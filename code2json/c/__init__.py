@@ -1,26 +1,14 @@
-from tree_sitter import Language, Parser, Node
-from typing import Dict, Optional, Tuple, List
-from interfaces import AbstractEntityParser, AbstractCodeParser
-import os.path
-
-directory = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-Language.build_library(
-    os.path.join(directory, "build", "treesitter_c.so"),
-    [os.path.join(directory, "tree-sitter-c")],
-)
-LANGUAGE = Language(os.path.join(directory, "build", "treesitter_c.so"), "c")
-
-parser = Parser()
-parser.set_language(LANGUAGE)
-
-UTF8 = 'utf-8'
+from collections import deque
+from tree_sitter import Node
+from typing import Dict, Generator, Optional, List
+from ..interfaces import AbstractEntityParser, AbstractCodeParser
 
 
 class SequenceParser(AbstractEntityParser):
-    def parse(self, seq_name, *args, **kwargs) -> Optional[dict]:
+    def parse(self, seq_name, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = []
         for node in self._node.children:
-            if entity_node := self._parser.parse_node(node):
+            if entity_node := (yield node):
                 if isinstance(entity_node, list):
                     for item in entity_node:
                         result.append(item)
@@ -36,39 +24,55 @@ class SequenceParser(AbstractEntityParser):
 
 
 class AbstractExpressionParser(AbstractEntityParser):
-    def find_function_calls(self, parent_node) -> Dict:
-        children = [parent_node]
+    def _parse_call(self, node) -> Optional[dict]:
+        """func_call of a call node, None if the callee is not a known function."""
+        name = self._parser.text(node.child_by_field_name("function"))
+        if (func_id := self._parser.find_function_id(name)) is None:
+            return None
+        args = self.parse_func_args(node.child_by_field_name("arguments"))
+        return FunctionCallParser(node, self._parser).parse(func_id, args, name)
+
+    def find_function_calls(self, parent_node, first_only=False) -> List[Dict]:
+        """Breadth-first search for calls of known functions.
+
+        Calls nested in another call are not collected here, they become
+        arguments of the enclosing call, so every node is visited once.
+        """
         result = []
-        while len(children):
-            node = children.pop(0)
+        queue = deque([parent_node])
+        while queue:
+            node = queue.popleft()
             if node.type == "call_expression":
-                name = node.child_by_field_name("function").text.decode(UTF8)
-                args = self.parse_func_args(node.child_by_field_name("arguments"))
-                if function := self._parser.find_function(name)[1]:
-                    result.append(
-                        FunctionCallParser(node, self._parser).parse(
-                            function, args, self._node.text.decode(UTF8)
-                        )
-                    )
-                if node == parent_node:
-                    children.extend(node.children)
-            else:
-                children.extend(node.children)
+                if function_call := self._parse_call(node):
+                    result.append(function_call)
+                    if first_only:
+                        break
+                if node != parent_node:
+                    continue
+            queue.extend(node.children)
         return result
 
     def parse_func_args(self, args) -> List[Dict]:
-        children = [args]
         result = []
-        while len(children):
-            node = children.pop(0)
+        queue = deque([args])
+        while queue:
+            node = queue.popleft()
             if node.type == "call_expression":
-                result.append(self.find_function_calls(node)[0])
-            else:
-                if node.type != "argument_list":
+                # an unknown callee is represented by the first known call
+                # inside it, or by its text if there is none
+                function_calls = self.find_function_calls(node, first_only=True)
+                if function_calls:
+                    result.append(function_calls[0])
+                else:
                     result.append(
-                        {"type": "argument", "name": node.text.decode(UTF8)}
+                        {"type": "argument", "name": self._parser.text(node)}
                     )
-                children.extend(node.named_children)
+                continue
+            if node.type != "argument_list":
+                result.append(
+                    {"type": "argument", "name": self._parser.text(node)}
+                )
+            queue.extend(node.named_children)
         return result
 
 
@@ -87,7 +91,7 @@ class StatementParser(AbstractExpressionParser):
         else:
             type = "stmt"
 
-        name = self._node.text.decode(UTF8).strip(";")
+        name = self._parser.text(self._node).strip(";")
 
         return {
             "id": self._parser.get_new_id(),
@@ -98,12 +102,12 @@ class StatementParser(AbstractExpressionParser):
 
 
 class FunctionCallParser(AbstractEntityParser):
-    def parse(self, function, arguments, call_expr, *args, **kwargs) -> Optional[dict]:
+    def parse(self, func_id, arguments, func_name, *args, **kwargs) -> Optional[dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "func_call",
-            "func_name": self._node.child_by_field_name("function").text.decode(UTF8),
-            "func_id": function["id"],
+            "func_name": func_name,
+            "func_id": func_id,
             "func_args": arguments,
         }
         result["position"] = [
@@ -116,7 +120,7 @@ class FunctionCallParser(AbstractEntityParser):
 
 
 class ConditionParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "alternative",
@@ -124,42 +128,43 @@ class ConditionParser(AbstractEntityParser):
         }
 
         alternative = self._node.child_by_field_name("alternative")
-        self._parse_branches(alternative, result["branches"])
+        yield from self._parse_branches(alternative, result["branches"])
         condition = self._node.child_by_field_name("condition")
         result["branches"][0]["cond"] = ExpressionParser(condition, self._parser).parse()
         body = self._node.child_by_field_name("consequence")
         comment_node = None if not len(body.named_children) else body.named_children[0]
         if comment_node and comment_node.type == "comment":
-            result["name"] = comment_node.text.decode(UTF8).lstrip('/').strip()
+            result["name"] = self._parser.text(comment_node).lstrip('/').strip()
         for child in body.children:
-            if tree_node := self._parser.parse_node(child):
+            if tree_node := (yield child):
                 result["branches"][0]["body"].append(tree_node)
         return result
 
-    def _parse_branches(self, node, branches) -> Optional[dict]:
-        result = {"id": self._parser.get_new_id(), "body": []}
-        body = None
-        node = node.named_children[0]
-        next = None
-
-        if node.type == "if_statement":
-            result["type"] = "else-if"
-            body = node.child_by_field_name("consequence")
-            condition = node.child_by_field_name("condition")
-            result["cond"] = ExpressionParser(condition, self._parser).parse()
-            next = node.child_by_field_name("alternative")
-        else:
-            result["type"] = "else"
-            if len(node.named_children):
-                body = node.named_children[0]
+    def _parse_branches(self, node, branches) -> Generator[Node, Optional[dict], None]:
+        # an else-if chain is nested in the syntax tree, one alternative in
+        # the other; it is walked in a loop instead of one call per branch
+        while node:
+            result = {"id": self._parser.get_new_id(), "body": []}
+            node = node.named_children[0]
+            next = None
+
+            if node.type == "if_statement":
+                result["type"] = "else-if"
+                body = node.child_by_field_name("consequence")
+                condition = node.child_by_field_name("condition")
+                result["cond"] = ExpressionParser(condition, self._parser).parse()
+                next = node.child_by_field_name("alternative")
             else:
-                return
-        for child in body.named_children:
-            if tree_node := self._parser.parse_node(child):
-                result["body"].append(tree_node)
-        branches.append(result)
-        if next:
-            self._parse_branches(next, branches)
+                result["type"] = "else"
+                if len(node.named_children):
+                    body = node.named_children[0]
+                else:
+                    return
+            for child in body.named_children:
+                if tree_node := (yield child):
+                    result["body"].append(tree_node)
+            branches.append(result)
+            node = next
 
 
 def strip_both_parens(code_str) -> str:
@@ -173,36 +178,40 @@ class ExpressionParser(AbstractExpressionParser):
         return {
             "id": self._parser.get_new_id(),
             "type": "expr",
-            "name": strip_both_parens(self._node.text.decode(UTF8)),
+            "name": strip_both_parens(self._parser.text(self._node)),
             "func_calls": self.find_function_calls(self._node),
         }
 
 
 class FunctionParser(AbstractEntityParser):
-    def parse(self) -> Optional[dict]:
+    @staticmethod
+    def function_name(parser, node) -> str:
+        declarator = node.child_by_field_name("declarator")
+        return parser.text(declarator.child_by_field_name("declarator"))
+
+    def parse(self) -> Generator[Node, Optional[dict], dict]:
         declarator = self._node.child_by_field_name("declarator")
-        name = declarator.child_by_field_name("declarator").text.decode(UTF8)
         obj = {
-            "id": self._parser.get_new_id(),
+            "id": self._parser.get_function_id(self._node),
             "type": "func",
-            "name": name,
+            "name": self.function_name(self._parser, self._node),
             "param_list": [],
         }
         obj["is_entry"] = obj["name"] == "main"
         params = declarator.child_by_field_name("parameters")
         for param in params.named_children:
-            obj["param_list"].append(param.text.decode(UTF8))
+            obj["param_list"].append(self._parser.text(param))
         if return_type := self._node.child_by_field_name("type"):
-            obj["return_type"] = return_type.text.decode(UTF8)
+            obj["return_type"] = self._parser.text(return_type)
         seq_name = obj["name"] + "-body"
-        obj["body"] = SequenceParser(
+        obj["body"] = yield from SequenceParser(
             self._node.child_by_field_name("body"), self._parser
         ).parse(seq_name)
         return obj
 
 
 class WhileLoopParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "while_loop",
@@ -215,21 +224,21 @@ class WhileLoopParser(AbstractEntityParser):
         body = self._node.child_by_field_name("body")
         comment_node = None if not len(body.named_children) else body.named_children[0]
         if comment_node and comment_node.type == "comment":
-            result["name"] = comment_node.text.decode(UTF8).lstrip('/').strip()
-        name = result.get("name", str(result["id"])) + "_loop_body"
-        result["body"] = SequenceParser(body, self._parser).parse(name)
+            result["name"] = self._parser.text(comment_node).lstrip('/').strip()
+        name = self._parser.loop_body_name(result)
+        result["body"] = yield from SequenceParser(body, self._parser).parse(name)
 
         return result
 
 
 class ForLoopParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         initializer = self._node.child_by_field_name("initializer")
         condition = self._node.child_by_field_name("condition")
         update = self._node.child_by_field_name("update")
         result = {"id": self._parser.get_new_id(), "body": {}, "type": "for_loop"}
         if initializer:
-            result["init"] = initializer.text.decode(UTF8)
+            result["init"] = self._parser.text(initializer)
             result["init"] = result["init"].rstrip(";")
         else:
             result["init"] = ""
@@ -241,15 +250,13 @@ class ForLoopParser(AbstractEntityParser):
             result["cond"] = ""
 
         if update:
-            result["update"] = update.text.decode(UTF8)
+            result["update"] = self._parser.text(update)
         else:
             result["update"] = ""
 
         if initializer:
-            result["variable"] = (
-                initializer.child_by_field_name("declarator")
-                .named_children[0]
-                .text.decode(UTF8)
+            result["variable"] = self._parser.text(
+                initializer.child_by_field_name("declarator").named_children[0]
             )
         else:
             result["variable"] = None
@@ -257,20 +264,23 @@ class ForLoopParser(AbstractEntityParser):
         body = self._node.child_by_field_name("body")
         comment_node = None if not len(body.named_children) else body.named_children[0]
         if comment_node and comment_node.type == "comment":
-            result["name"] = comment_node.text.decode(UTF8).lstrip('/').strip()
-        name = result.get("name", str(result["id"])) + "_loop_body"
-        result["body"] = SequenceParser(body, self._parser).parse(name)
+            result["name"] = self._parser.text(comment_node).lstrip('/').strip()
+        name = self._parser.loop_body_name(result)
+        result["body"] = yield from SequenceParser(body, self._parser).parse(name)
 
         return result
 
 
 class CompoundStatementParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[List[dict]]:
-        children = self._node.named_children
-        return [self._parser.parse_node(child) for child in children]
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], list]:
+        result = []
+        for child in self._node.named_children:
+            result.append((yield child))
+        return result
 
 
 class C2JSONParser(AbstractCodeParser):
+    LANG = "c"
     TYPE_PARSER = {
         "function_definition": FunctionParser,
         "expression_statement": StatementParser,
@@ -284,38 +294,6 @@ class C2JSONParser(AbstractCodeParser):
         "compound_statement": CompoundStatementParser,
     }
 
-    def __init__(self, code: bytes):
-        self._tree = parser.parse(code)
-        # print(self._tree.root_node.sexp())
-        self._id_counter = 0
-        self._result = {
-            "id": self.get_new_id(),
-            "functions": [],
-            "global_code": {"body": [], "name": "global_code", "type": "sequence"},
-            "name": "algorithm",
-            "type": "algorithm",
-        }
-
-    def parse_node(self, node: Node):
-        entity_parser = self.TYPE_PARSER.get(node.type)
-        if entity_parser:
-            return entity_parser(node, self).parse()
-
-    def parse_all(self):
-        for node in self._tree.root_node.children:
-            if result := self.parse_node(node):
-                if result["type"] == "func":
-                    self._result["functions"].append(result)
-                else:
-                    self._result["global_code"]["body"].append(result)
-        return self._result
-
-    def find_function(self, name: str) -> Tuple[int, Optional[dict]]:
-        for i, function in enumerate(self._result["functions"]):
-            if function["name"] == name:
-                return i, function
-        return -1, None
-
-    def get_new_id(self):
-        self._id_counter += 1
-        return self._id_counter
+    def definition_name(self, node: Node) -> Optional[str]:
+        if node.type == "function_definition":
+            return FunctionParser.function_name(self, node)
@@ -0,0 +1,94 @@
+"""On-disk cache of parse results.
+
+A result is keyed by a hash of the source bytes together with the
+language, the module name (it changes how Python calls resolve), the
+compiled grammar and a digest of the parser code, so any change of the
+grammar or of a frontend misses instead of serving a stale tree. Values
+are the serialized algorithm tree, in the compact format when msgpack is
+installed and as JSON otherwise.
+
+One directory may be shared by many processes (see store.py); the least
+recently used entries are removed when it grows over its limit. Hit and
+miss counters are per instance.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Optional
+
+from . import compact
+from .grammars import library_path
+from .store import DiskStore, package_digest
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+@lru_cache(maxsize=None)
+def code_digest() -> str:
+    """Digest of the parser code: every module of the package."""
+    return package_digest(os.path.dirname(os.path.abspath(__file__)), (".py",))
+
+
+@lru_cache(maxsize=None)
+def grammar_version(lang: str) -> str:
+    # the library is named after a digest of the grammar sources
+    return os.path.basename(library_path(lang))
+
+
+def _serialize(tree: dict) -> bytes:
+    try:
+        return compact.dumps(tree)
+    except RuntimeError:
+        return json.dumps(tree, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ParseCache:
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._disk = DiskStore(directory, ".tree", max_bytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def key(self, code, lang: str, module: Optional[str] = None) -> str:
+        digest = hashlib.sha1(
+            json.dumps([lang, module, grammar_version(lang), code_digest()]).encode()
+        )
+        digest.update(code)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        tree = None
+        data = self._disk.get(key)
+        if data is not None:
+            try:
+                tree = compact.load_tree(data)
+            except (ValueError, RuntimeError):
+                pass
+        with self._lock:
+            if tree is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return tree
+
+    def put(self, key: str, tree: dict):
+        if self._disk.put(key, _serialize(tree)):
+            with self._lock:
+                self.stores += 1
+
+    def clear(self):
+        self._disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self._disk.evictions,
+            }
@@ -0,0 +1,124 @@
+"""Compact binary encoding of the algorithm tree.
+
+The tree is written as MessagePack where every known field name is
+replaced by its index in FIELDS and every known node type by its index in
+TYPES, behind a short MAGIC header. Names that are not in the tables (a
+newer frontend, a hand-written tree) are kept as plain strings, so
+decoding always gives back exactly the dict that was encoded. The tables
+are append-only: reordering them breaks every file written before.
+
+MessagePack is an optional dependency (``pip install msgpack``); JSON
+stays the default format of both tools.
+"""
+import json
+from typing import Union
+
+MAGIC = b"C2J\x01"
+
+FIELDS = (
+    "id",
+    "type",
+    "name",
+    "body",
+    "func_calls",
+    "func_name",
+    "func_id",
+    "func_args",
+    "position",
+    "functions",
+    "global_code",
+    "branches",
+    "cond",
+    "param_list",
+    "is_entry",
+    "return_type",
+    "variable",
+    "init",
+    "update",
+    "start",
+    "stop",
+    "step",
+    "container",
+)
+
+TYPES = (
+    "algorithm",
+    "sequence",
+    "func",
+    "stmt",
+    "stmt_with_calls",
+    "break",
+    "continue",
+    "return",
+    "func_call",
+    "argument",
+    "alternative",
+    "if",
+    "else-if",
+    "else",
+    "expr",
+    "while_loop",
+    "for_loop",
+    "foreach_loop",
+)
+
+_FIELD_CODES = {name: code for code, name in enumerate(FIELDS)}
+_TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+_TYPE_FIELD = _FIELD_CODES["type"]
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError(
+            "the compact format needs the msgpack package (pip install msgpack)"
+        ) from None
+    return msgpack
+
+
+def _encode(obj):
+    if isinstance(obj, dict):
+        result = {}
+        for key, value in obj.items():
+            if key == "type":
+                result[_TYPE_FIELD] = _TYPE_CODES.get(value, value)
+            else:
+                result[_FIELD_CODES.get(key, key)] = _encode(value)
+        return result
+    if isinstance(obj, list):
+        return [_encode(item) for item in obj]
+    return obj
+
+
+def _decode_map(pairs):
+    result = {}
+    for key, value in pairs:
+        if key == _TYPE_FIELD and type(value) is int:
+            value = TYPES[value]
+        result[FIELDS[key] if type(key) is int else key] = value
+    return result
+
+
+def dumps(tree: dict) -> bytes:
+    """Encode a tree produced by a code parser."""
+    return MAGIC + _msgpack().packb(_encode(tree), use_bin_type=True)
+
+
+def loads(data: bytes) -> dict:
+    """Decode bytes written by dumps()."""
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a compact algorithm tree")
+    return _msgpack().unpackb(
+        memoryview(data)[len(MAGIC):],
+        raw=False,
+        strict_map_key=False,
+        object_pairs_hook=_decode_map,
+    )
+
+
+def load_tree(data: Union[bytes, str]) -> dict:
+    """Decode a tree in either format, telling them apart by the header."""
+    if isinstance(data, (bytes, bytearray)) and data[:len(MAGIC)] == MAGIC:
+        return loads(data)
+    return json.loads(data)
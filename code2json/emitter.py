@@ -0,0 +1,68 @@
+"""Streaming JSON output of the algorithm tree.
+
+JSONStreamWriter serializes every top-level function and global statement
+as soon as the parser yields it, so the whole document never exists in
+memory at once. Global code comes after the functions in the document, so
+it is spooled to a temporary file (in memory while small) until all
+functions have been written. The output is byte-for-byte what
+``json.dumps(parse_all(), ensure_ascii=False, indent=True)`` gives, or the
+compact ``separators=(",", ":")`` form.
+"""
+import json
+import shutil
+from tempfile import SpooledTemporaryFile
+
+from .interfaces import AbstractCodeParser
+
+SPOOL_SIZE = 1 << 20
+
+
+class JSONStreamWriter:
+    def __init__(self, fobj, compact: bool = False):
+        self._fobj = fobj
+        self._compact = compact
+        self._colon = ":" if compact else ": "
+
+    def _newline(self, level: int) -> str:
+        return "" if self._compact else "\n" + " " * level
+
+    def _dumps(self, obj, level: int) -> str:
+        if self._compact:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        text = json.dumps(obj, ensure_ascii=False, indent=True)
+        return text.replace("\n", self._newline(level))
+
+    def _key(self, name: str, level: int) -> str:
+        return self._newline(level) + json.dumps(name) + self._colon
+
+    def _write_fields(self, obj: dict, skip, level: int):
+        for name, value in obj.items():
+            if name not in skip:
+                self._fobj.write(",%s%s" % (self._key(name, level), self._dumps(value, level)))
+
+    def write(self, parser: AbstractCodeParser):
+        write = self._fobj.write
+        root = parser.result
+        global_code = root["global_code"]
+        function_count = global_count = 0
+        write("{%s%s," % (self._key("id", 1), json.dumps(root["id"])))
+        write(self._key("functions", 1) + "[")
+        with SpooledTemporaryFile(SPOOL_SIZE, mode="w+", encoding="utf-8") as spool:
+            for result in parser.iter_parse():
+                if result["type"] == "func":
+                    write("," if function_count else "")
+                    write(self._newline(2) + self._dumps(result, 2))
+                    function_count += 1
+                else:
+                    spool.write("," if global_count else "")
+                    spool.write(self._newline(3) + self._dumps(result, 3))
+                    global_count += 1
+            write("%s]," % (self._newline(1) if function_count else ""))
+            write(self._key("global_code", 1) + "{" + self._key("body", 2) + "[")
+            spool.seek(0)
+            shutil.copyfileobj(spool, self._fobj)
+        write("%s]" % (self._newline(2) if global_count else ""))
+        self._write_fields(global_code, ("body",), 2)
+        write(self._newline(1) + "}")
+        self._write_fields(root, ("id", "functions", "global_code"), 1)
+        write(self._newline(0) + "}")
@@ -0,0 +1,234 @@
+"""Registry of tree-sitter grammars compiled once into a versioned cache.
+
+Every grammar is built into ``<cache>/<lang>-<digest>.so``, where the digest
+covers the grammar sources and the tree_sitter version, and is loaded lazily
+the first time the language is requested. A small manifest remembers which
+library belongs to which sources, so a warm start only stats a few files
+instead of hashing or compiling anything.
+
+A tree-sitter Parser must not be used by two threads at once, so parsers
+are handed out by a ParserPool per language: checkout() takes the parser
+cached for the calling thread, or an idle one, or a new one, and checkin()
+gives it back.
+
+Run this module as a script to prebuild the grammars (e.g. in a container
+image): ``python code2json/grammars.py [--cache-dir DIR] [LANG ...]``.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from importlib.metadata import version
+from typing import Dict, Iterator, List, Optional
+
+from tree_sitter import Language, Parser
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# language -> (grammar repository directory, grammar name inside the library)
+GRAMMARS = {
+    "python": ("tree-sitter-python", "python"),
+    "c": ("tree-sitter-c", "c"),
+}
+
+CACHE_DIR_ENV = "CODE2JSON_GRAMMAR_CACHE"
+# directory with the grammar repositories instead of the submodules
+SOURCES_DIR_ENV = "CODE2JSON_GRAMMAR_SOURCES"
+DEFAULT_CACHE_DIR = os.path.join(directory, "build", "grammars")
+MANIFEST = "manifest.json"
+
+_lock = threading.Lock()
+_languages: Dict[str, Language] = {}
+_pools: Dict[str, "ParserPool"] = {}
+
+
+def cache_dir() -> str:
+    return os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+
+
+def grammar_repository(lang: str) -> str:
+    return os.path.join(os.environ.get(SOURCES_DIR_ENV) or directory, GRAMMARS[lang][0])
+
+
+def grammar_sources(lang: str) -> List[str]:
+    """Return the sorted source files of a grammar, or [] if it is not checked out."""
+    repo = os.path.join(grammar_repository(lang), "src")
+    patterns = ("*.c", "*.cc", "**/*.h")
+    files = set()
+    for pattern in patterns:
+        files.update(glob.glob(os.path.join(repo, pattern), recursive=True))
+    return sorted(files)
+
+
+def _stamp(lang: str, sources: List[str]) -> List[list]:
+    repo = os.path.join(grammar_repository(lang), "src")
+    result = []
+    for path in sources:
+        stat = os.stat(path)
+        result.append([os.path.relpath(path, repo), stat.st_size, stat.st_mtime_ns])
+    return result
+
+
+def grammar_digest(lang: str) -> str:
+    """Content hash of the grammar sources and the tree_sitter version."""
+    digest = hashlib.sha1(version("tree_sitter").encode())
+    repo = os.path.join(grammar_repository(lang), "src")
+    for path in grammar_sources(lang):
+        digest.update(os.path.relpath(path, repo).encode())
+        with open(path, "rb") as fobj:
+            digest.update(fobj.read())
+    return digest.hexdigest()[:16]
+
+
+def _read_manifest(cache: str) -> dict:
+    try:
+        with open(os.path.join(cache, MANIFEST)) as fobj:
+            return json.load(fobj)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache: str, lang: str, entry: dict):
+    manifest = _read_manifest(cache)
+    manifest[lang] = entry
+    tmp_path = os.path.join(cache, "%s.%d.tmp" % (MANIFEST, os.getpid()))
+    with open(tmp_path, "w") as fobj:
+        json.dump(manifest, fobj, indent=1)
+    os.replace(tmp_path, os.path.join(cache, MANIFEST))
+
+
+def build(lang: str, cache: Optional[str] = None) -> str:
+    """Compile the grammar into the cache unless an up-to-date build exists."""
+    cache = cache or cache_dir()
+    sources = grammar_sources(lang)
+    if not sources:
+        raise FileNotFoundError(
+            "Sources of the %s grammar are missing (%s), run "
+            "`git submodule update --init` or set $%s"
+            % (lang, grammar_repository(lang), SOURCES_DIR_ENV)
+        )
+    os.makedirs(cache, exist_ok=True)
+    library = "%s-%s.so" % (lang, grammar_digest(lang))
+    path = os.path.join(cache, library)
+    if not os.path.exists(path):
+        # build next to the target and rename, so concurrent builders
+        # never load a half-written library
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        Language.build_library(tmp_path, [grammar_repository(lang)])
+        os.replace(tmp_path, path)
+    _write_manifest(cache, lang, {"library": library, "stamp": _stamp(lang, sources)})
+    return path
+
+
+def library_path(lang: str, cache: Optional[str] = None) -> str:
+    """Path of the compiled grammar, building it only when the sources changed."""
+    cache = cache or cache_dir()
+    entry = _read_manifest(cache).get(lang)
+    if entry:
+        path = os.path.join(cache, entry["library"])
+        sources = grammar_sources(lang)
+        # prebuilt images may ship the cache without the grammar sources
+        if os.path.exists(path) and (not sources or entry["stamp"] == _stamp(lang, sources)):
+            return path
+    return build(lang, cache)
+
+
+def get_language(lang: str) -> Language:
+    with _lock:
+        if lang not in _languages:
+            _languages[lang] = Language(library_path(lang), GRAMMARS[lang][1])
+        return _languages[lang]
+
+
+class ParserPool:
+    """Parsers of one language, each used by one thread at a time."""
+
+    def __init__(self, lang: str):
+        self.lang = lang
+        self._lock = threading.Lock()
+        self._idle: List[Parser] = []
+        self._local = threading.local()
+        self.created = 0
+
+    def checkout(self) -> Parser:
+        # the parser cached for this thread needs no lock; it is taken out
+        # of the cache, so a nested checkout gets another one
+        parser = getattr(self._local, "parser", None)
+        if parser is not None:
+            self._local.parser = None
+            return parser
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        parser = Parser()
+        parser.set_language(get_language(self.lang))
+        return parser
+
+    def checkin(self, parser: Parser):
+        parser.reset()
+        if getattr(self._local, "parser", None) is None:
+            self._local.parser = parser
+        else:
+            with self._lock:
+                self._idle.append(parser)
+
+    @contextmanager
+    def parser(self) -> Iterator[Parser]:
+        parser = self.checkout()
+        try:
+            yield parser
+        finally:
+            self.checkin(parser)
+
+
+def parser_pool(lang: str) -> ParserPool:
+    pool = _pools.get(lang)
+    if pool is None:
+        with _lock:
+            pool = _pools.setdefault(lang, ParserPool(lang))
+    return pool
+
+
+def get_parser(lang: str) -> Parser:
+    """The parser cached for the calling thread, created on first use.
+
+    It must not be passed to other threads; use parser_pool() to hold a
+    parser for a while.
+    """
+    pool = parser_pool(lang)
+    parser = pool.checkout()
+    pool.checkin(parser)
+    return parser
+
+
+def prebuild(langs=None, cache: Optional[str] = None) -> Dict[str, str]:
+    return {lang: build(lang, cache) for lang in (langs or GRAMMARS)}
+
+
+argument_parser = argparse.ArgumentParser(
+    description="Prebuild tree-sitter grammars into the grammar cache"
+)
+argument_parser.add_argument(
+    "langs", nargs="*", help="Languages to build (default: all of %s)" % ", ".join(GRAMMARS)
+)
+argument_parser.add_argument(
+    "--cache-dir",
+    help="Grammar cache directory (default: $%s or %s)" % (CACHE_DIR_ENV, DEFAULT_CACHE_DIR),
+)
+
+
+def main():
+    args = argument_parser.parse_args()
+    for lang in args.langs:
+        if lang not in GRAMMARS:
+            argument_parser.error("Unsupported programming language: %s" % lang)
+    for lang, path in prebuild(args.langs, args.cache_dir).items():
+        print(lang, path)
+
+
+if __name__ == "__main__":
+    main()
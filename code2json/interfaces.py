@@ -1,17 +1,331 @@
 from abc import ABC, abstractmethod
+from types import GeneratorType
+from typing import Dict, Iterator, Optional, Tuple
+
+from .grammars import parser_pool
+from .parallel import parse_nodes
+from .source import Source, reader
 
 
 class AbstractCodeParser(ABC):
-    def __init__(self, code):
-        pass
+    LANG: str = None
+    TYPE_PARSER: Dict[str, type] = {}
+
+    def __init__(self, code: Source, module: Optional[str] = None, cache=None, jobs: int = 1):
+        """``code`` is either bytes or a mapping from source.open_source().
+
+        With a ``cache`` (a cache.ParseCache) a result cached for the same
+        source is returned without parsing anything, and a parsed one is
+        stored in it. With ``jobs`` > 1 the top-level nodes are parsed over a
+        pool of that many processes (see parallel.py); the result is the
+        same as a serial parse.
+        """
+        self._module = module
+        self._code = code
+        self.jobs = jobs
+        self._source = self._view(code)
+        self._cache = cache
+        self._cache_key = None
+        self._cached = None
+        if cache is not None:
+            self._cache_key = cache.key(code, self.LANG, module)
+            self._cached = cache.get(self._cache_key)
+        self._tree = None if self._cached is not None else self._parse(code)
+        self._reset()
+
+    @staticmethod
+    def _view(code: Source):
+        # text of nodes is decoded straight from this view of the source,
+        # without copying every node's bytes first; slices of a mapping are
+        # already small copies, and a mapping with no views into it can be
+        # closed while the parser is still alive
+        return memoryview(code) if isinstance(code, bytes) else code
+
+    def _parse(self, code: Source, old_tree=None):
+        source = code if isinstance(code, bytes) else reader(code)
+        with parser_pool(self.LANG).parser() as parser:
+            if old_tree is None:
+                return parser.parse(source)
+            return parser.parse(source, old_tree)
+
+    def _reset(self):
+        self._id_counter = 0
+        self._result = {
+            "id": self.get_new_id(),
+            "functions": [],
+            "global_code": {"body": [], "name": "global_code", "type": "sequence"},
+            "name": "algorithm",
+            "type": "algorithm",
+        }
+        # filled by the definitions pre-pass: function name -> reserved id,
+        # and definition node id -> reserved id
+        self._function_ids = {}
+        self._reserved_ids = {}
+        # (name, id) of the top-level definitions in source order
+        self._definitions = []
+        # one (start_byte, end_byte, start_row, end_row, type, result) entry
+        # per top-level node, used to reuse results in edit()
+        self._entries = []
+
+    def text(self, node) -> str:
+        """Source text of a node."""
+        return str(self._source[node.start_byte:node.end_byte], "utf-8")
 
     @abstractmethod
-    def parse_all(self):
+    def definition_name(self, node) -> Optional[str]:
+        """Name of the function defined by a top-level node, None for other nodes."""
         pass
 
-    @abstractmethod
     def parse_node(self, node):
-        pass
+        """Result of the entity parser of a node type, None for other nodes.
+
+        Entity parsers of nodes with nested statements are generators: they
+        yield every child node to parse and are sent its result back. They
+        are driven here from an explicit stack, so the nesting depth of the
+        code is not limited by the recursion limit.
+        """
+        entity_parser = self.TYPE_PARSER.get(node.type)
+        if entity_parser is None:
+            return None
+        result = entity_parser(node, self).parse()
+        if not isinstance(result, GeneratorType):
+            return result
+        stack = [result]
+        value = None
+        while stack:
+            try:
+                node = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            value = None
+            entity_parser = self.TYPE_PARSER.get(node.type)
+            if entity_parser is not None:
+                result = entity_parser(node, self).parse()
+                if isinstance(result, GeneratorType):
+                    stack.append(result)
+                else:
+                    value = result
+        return value
+
+    @property
+    def code(self) -> Source:
+        """The source code, bytes or a mapping."""
+        return self._code
+
+    @property
+    def module(self) -> Optional[str]:
+        return self._module
+
+    @property
+    def tree(self):
+        """The tree-sitter syntax tree, None for a result served from the cache."""
+        return self._tree
+
+    @property
+    def from_cache(self) -> bool:
+        """True if the result comes from the parse cache."""
+        return self._cached is not None
+
+    @property
+    def result(self) -> dict:
+        """The algorithm document, complete after parse_all()."""
+        return self._result
+
+    def document(self, functions: list, global_code: list) -> dict:
+        """The algorithm document with these functions and global statements.
+
+        For results collected from iter_parse(); the parser's own document
+        is left as it is.
+        """
+        tree = dict(self._result, functions=functions)
+        tree["global_code"] = dict(tree["global_code"], body=global_code)
+        return tree
+
+    def parse_all(self):
+        if self._cached is not None:
+            self._result["functions"].extend(self._cached["functions"])
+            self._result["global_code"]["body"].extend(self._cached["global_code"]["body"])
+            return self._result
+        for node, result in self._parse_nodes():
+            self._add_entry(node, result)
+        if self._cache is not None:
+            self._cache.put(self._cache_key, self._result)
+        return self._result
+
+    def iter_parse(self) -> Iterator[dict]:
+        """Yields every top-level function or statement as soon as it is parsed.
+
+        Unlike parse_all() nothing is kept in the document, so memory does
+        not grow with the size of the source; edit() is not available then.
+        With a cache the results are kept until the end to be stored.
+        Functions and global statements keep their order among themselves.
+        """
+        if self._cached is not None:
+            yield from self._cached["functions"]
+            yield from self._cached["global_code"]["body"]
+            return
+        functions = []
+        global_code = []
+        for node, result in self._parse_nodes():
+            if result:
+                if self._cache is not None:
+                    (functions if result["type"] == "func" else global_code).append(result)
+                yield result
+        if self._cache is not None:
+            self._cache.put(self._cache_key, self.document(functions, global_code))
+
+    def _parse_nodes(self) -> Iterator[Tuple[object, Optional[dict]]]:
+        """Run the definitions pre-pass, then yield (node, result) per top-level node."""
+        self.collect_definitions(self._tree.root_node)
+        children = self._tree.root_node.children
+        if self.jobs > 1 and len(children) > 1:
+            yield from parse_nodes(self, self.jobs)
+            return
+        for node in children:
+            yield node, self.parse_node(node)
+
+    def _add_entry(self, node, result: Optional[dict]):
+        self._entries.append(
+            (
+                node.start_byte,
+                node.end_byte,
+                node.start_point[0],
+                node.end_point[0],
+                node.type,
+                result,
+            )
+        )
+        if result:
+            if result["type"] == "func":
+                self._result["functions"].append(result)
+            else:
+                self._result["global_code"]["body"].append(result)
+
+    def edit(self, start_byte: int, old_end_byte: int, new_text: bytes) -> dict:
+        """Replaces code[start_byte:old_end_byte] with new_text and updates the result.
+
+        The previous tree is reused by tree-sitter, and only the top-level
+        nodes touching the edited or structurally changed lines are parsed
+        again; the others keep their results and ids. If the set of
+        top-level function definitions changes, the result is rebuilt.
+        """
+        if self._tree is None:
+            # the result came from the cache, edits need the syntax tree
+            self._cached = None
+            self._tree = self._parse(self._code)
+            self._reset()
+            self.parse_all()
+        # the edited source is new bytes anyway, even for a mapped file
+        code = bytes(self._code)
+        new_code = code[:start_byte] + new_text + code[old_end_byte:]
+        new_end_byte = start_byte + len(new_text)
+        start_point = self._point(code, start_byte)
+        old_end_point = self._point(code, old_end_byte)
+        new_end_point = self._point(new_code, new_end_byte)
+        self._tree.edit(
+            start_byte, old_end_byte, new_end_byte,
+            start_point, old_end_point, new_end_point,
+        )
+        old_tree = self._tree
+        self._tree = self._parse(new_code, old_tree)
+        self._code = new_code
+        self._source = self._view(new_code)
+
+        nodes = self._tree.root_node.children
+        node_names = [self.definition_name(node) for node in nodes]
+        names = [name for name in node_names if name]
+        if names != [name for name, _ in self._definitions]:
+            self._reset()
+            return self.parse_all()
+
+        dirty_rows = [(start_point[0], new_end_point[0])]
+        for changed in old_tree.changed_ranges(self._tree):
+            dirty_rows.append((changed.start_point[0], changed.end_point[0]))
+        byte_delta = new_end_byte - old_end_byte
+        row_delta = new_end_point[0] - old_end_point[0]
+        reusable = {}
+        for start, end, start_row, end_row, type, result in self._entries:
+            if start >= old_end_byte:
+                start, end = start + byte_delta, end + byte_delta
+                start_row, end_row = start_row + row_delta, end_row + row_delta
+            for low, high in dirty_rows:
+                if low <= end_row and start_row <= high:
+                    break
+            else:
+                reusable[(start, end, type)] = result
+
+        definition_ids = iter([func_id for _, func_id in self._definitions])
+        self._entries = []
+        self._result["functions"] = []
+        self._result["global_code"]["body"] = []
+        for node, name in zip(nodes, node_names):
+            func_id = next(definition_ids) if name else None
+            key = (node.start_byte, node.end_byte, node.type)
+            if key in reusable:
+                self._add_entry(node, reusable[key])
+                continue
+            if func_id is not None:
+                # a changed function keeps its id, so calls to it stay valid
+                self._reserved_ids[node.id] = func_id
+            self._add_entry(node, self.parse_node(node))
+        return self._result
+
+    @staticmethod
+    def _point(code: bytes, byte: int) -> Tuple[int, int]:
+        row = code.count(b"\n", 0, byte)
+        return row, byte - (code.rfind(b"\n", 0, byte) + 1)
+
+    def collect_definitions(self, root):
+        """Pre-pass over the top-level nodes only, reserving ids of all
+        function definitions so calls can refer to functions defined later."""
+        for node in root.children:
+            if name := self.definition_name(node):
+                func_id = self.get_new_id()
+                self._reserved_ids[node.id] = func_id
+                self._definitions.append((name, func_id))
+                for qualified_name in self.qualified_names(name):
+                    # the first definition wins, like the former linear search did
+                    self._function_ids.setdefault(qualified_name, func_id)
+
+    def get_function_id(self, node) -> int:
+        """Id of a function definition node, reserved by the pre-pass if possible."""
+        if (func_id := self._reserved_ids.pop(node.id, None)) is not None:
+            return func_id
+        return self.get_new_id()
+
+    def find_function_id(self, name: str) -> Optional[int]:
+        """Id of the function a call by this name refers to, wherever it is defined."""
+        return self._function_ids.get(name)
+
+    def qualified_names(self, name: str) -> Iterator[str]:
+        yield name
+        if self._module:
+            yield f"{self._module}.{name}"
+
+    def get_new_id(self):
+        self._id_counter += 1
+        return self._id_counter
+
+    @property
+    def last_id(self) -> int:
+        """The last id handed out."""
+        return self._id_counter
+
+    def restart_ids(self, last_id: int):
+        """Hand out the ids after ``last_id`` from now on."""
+        self._id_counter = last_id
+
+    @staticmethod
+    def loop_body_name(loop: dict) -> str:
+        """Name of the body sequence of a loop result.
+
+        Loops without a comment name their body after their own id. Every
+        name derived from an id is made here, so that parallel.shift_ids()
+        can make it again for a shifted id.
+        """
+        return loop.get("name", str(loop["id"])) + "_loop_body"
 
 
 class AbstractEntityParser(ABC):
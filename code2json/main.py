@@ -1,9 +1,15 @@
 import argparse
-import json
-from pathlib import Path
+import os
+import sys
 
-from python.__init__ import Python2JSONParser
-from c.__init__ import C2JSONParser
+from .python import Python2JSONParser
+from .c import C2JSONParser
+from .batch import collect_inputs, parser_options, run_batch
+from .cache import ParseCache
+from .emitter import JSONStreamWriter
+from .source import open_source
+from .table import NodeTable
+from . import compact
 
 
 LANGUAGES = {"python": Python2JSONParser, "c": C2JSONParser}
@@ -12,30 +18,103 @@ argument_parser = argparse.ArgumentParser(
     description="Compile source code to JSON tree"
 )
 argument_parser.add_argument("lang", help="Programming language of given source code (one of: %s)" % (', '.join(LANGUAGES)))
-argument_parser.add_argument("input", help="Path to input source code file")
+argument_parser.add_argument(
+    "input",
+    nargs="+",
+    help="Path to input source code file; several files, directories or glob patterns switch to batch mode",
+)
+argument_parser.add_argument(
+    "-o", "--output", help="Write the JSON tree to this file instead of stdout"
+)
+argument_parser.add_argument(
+    "--compact", action="store_true", default=False, help="Write JSON without indentation"
+)
+argument_parser.add_argument(
+    "--format",
+    choices=("json", "compact", "table"),
+    default="json",
+    help="Output format: JSON text, the compact binary encoding (needs msgpack) "
+    "or a serialized node table that json2html renders without building dicts",
+)
+argument_parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Worker processes: over files in batch mode (default: CPU count), "
+    "over top-level functions of a single file (default: 1)",
+)
+argument_parser.add_argument(
+    "--output-dir", help="Write batch results under this directory instead of next to the inputs"
+)
+argument_parser.add_argument(
+    "--jsonl", help="Write batch results into a single JSON Lines file"
+)
+argument_parser.add_argument(
+    "--cache", help="Reuse parse results of unchanged files from this cache directory"
+)
 
 
 def main():
-    default_cmd_args = ['c', "examples/example8.c"]
+    args = argument_parser.parse_args()
 
-    args = argument_parser.parse_args(default_cmd_args)
-    
-    with open(args.input, "rb") as fobj:
-        data = fobj.read()
-        
     if args.lang.lower() not in LANGUAGES:
         print("Unsupported programming language")
         return
-    
-    parser = LANGUAGES[args.lang.lower()](data)
-    result = parser.parse_all()
-    json_str = json.dumps(result, ensure_ascii=False, indent=True)
-    print(json_str)
-
-    out_p = Path(args.input)
-    out_p = out_p.with_suffix('.json')
-    with out_p.open('w') as f:
-        f.write(json_str + '\n')
+
+    if args.jsonl and args.format != "json":
+        argument_parser.error("--jsonl only supports the json format")
+
+    if len(args.input) > 1 or not os.path.isfile(args.input[0]) or args.output_dir or args.jsonl:
+        try:
+            paths = collect_inputs(args.lang.lower(), args.input)
+        except FileNotFoundError as e:
+            argument_parser.error(str(e))
+        failures = run_batch(
+            LANGUAGES[args.lang.lower()],
+            args.lang.lower(),
+            paths,
+            jobs=args.jobs,
+            output_dir=args.output_dir,
+            jsonl=args.jsonl,
+            compact=args.compact,
+            output_format=args.format,
+            cache_dir=args.cache,
+        )
+        sys.exit(1 if failures else 0)
+
+    options = parser_options(args.lang.lower(), args.input[0])
+    if args.cache:
+        options["cache"] = ParseCache(args.cache)
+    if args.jobs and args.jobs > 1:
+        options["jobs"] = args.jobs
+    with open_source(args.input[0]) as data:
+        parser = LANGUAGES[args.lang.lower()](data, **options)
+        if args.format != "json":
+            if args.format == "table":
+                encoded = NodeTable.from_parser(parser).dumps()
+            else:
+                encoded = compact.dumps(parser.parse_all())
+            if args.output:
+                with open(args.output, "wb") as f:
+                    f.write(encoded)
+            else:
+                sys.stdout.buffer.write(encoded)
+        elif args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                JSONStreamWriter(f, compact=args.compact).write(parser)
+                f.write("\n")
+        else:
+            try:
+                JSONStreamWriter(sys.stdout, compact=args.compact).write(parser)
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # the reader stopped early (e.g. `| head`): point stdout at
+                # devnull so flushing it at exit does not fail again
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""Parsing of the top-level nodes of one source over a process pool.
+
+Top-level nodes are split into contiguous ranges and parsed in worker
+processes. Every worker parses the source and runs the definitions pre-pass
+once, so it knows the same function ids as the parent, and then parses any
+range it is given with the id counter starting where the pre-pass left it.
+The parent takes the ranges back in order and shifts the ids of each by the
+number of ids the ranges before it used, which gives exactly the ids, and
+so the document, of a serial run.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+_worker = {}
+
+
+def _init_worker(parser_class, code: bytes, module: Optional[str]):
+    parser = parser_class(code, module=module)
+    parser.collect_definitions(parser.tree.root_node)
+    _worker.update(
+        parser=parser,
+        children=parser.tree.root_node.children,
+        base=parser.last_id,
+    )
+
+
+def _parse_range(start: int, stop: int) -> Tuple[List[Optional[dict]], int]:
+    """Results of the top-level nodes start..stop and the number of ids used."""
+    parser = _worker["parser"]
+    parser.restart_ids(_worker["base"])
+    results = [parser.parse_node(node) for node in _worker["children"][start:stop]]
+    return results, parser.last_id - _worker["base"]
+
+
+def shift_ids(parser, result: dict, base: int, offset: int):
+    """Add ``offset`` to every id above ``base`` in a result, in place.
+
+    Ids up to ``base`` are the function ids of the definitions pre-pass,
+    which are the same in every process. Loop body names that were made
+    from an id (see AbstractCodeParser.loop_body_name) are made again.
+    """
+    stack = [result]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+            continue
+        if not isinstance(item, dict):
+            continue
+        if item.get("id", 0) > base:
+            body = item.get("body")
+            renamed = isinstance(body, dict) and body.get("name") == parser.loop_body_name(item)
+            item["id"] += offset
+            if renamed:
+                body["name"] = parser.loop_body_name(item)
+        stack.extend(value for value in item.values() if isinstance(value, (dict, list)))
+
+
+def parse_nodes(parser, jobs: int) -> Iterator[Tuple[object, Optional[dict]]]:
+    """Yield (node, result) for every top-level node of a parser in order.
+
+    The definitions pre-pass must have run already.
+    """
+    children = parser.tree.root_node.children
+    base = parser.last_id
+    chunksize = max(1, min(256, len(children) // (jobs * 4)))
+    used = 0
+    pending = deque()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(type(parser), bytes(parser.code), parser.module),
+    ) as executor:
+
+        def finish():
+            nonlocal used
+            start, future = pending.popleft()
+            results, count = future.result()
+            for node, result in zip(children[start:], results):
+                if result is not None and used:
+                    shift_ids(parser, result, base, used)
+                yield node, result
+            used += count
+
+        for start in range(0, len(children), chunksize):
+            pending.append((start, executor.submit(_parse_range, start, start + chunksize)))
+            if len(pending) > jobs * 2:
+                yield from finish()
+        while pending:
+            yield from finish()
+    parser.restart_ids(base + used)
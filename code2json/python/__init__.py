@@ -1,26 +1,14 @@
-from tree_sitter import Language, Parser, Node
-from typing import Dict, Optional, Tuple, List
-from interfaces import AbstractEntityParser, AbstractCodeParser
-import os.path
-
-directory = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-Language.build_library(
-    os.path.join(directory, "build", "treesitter_python.so"),
-    [os.path.join(directory, "tree-sitter-python")],
-)
-PY_LANGUAGE = Language(
-    os.path.join(directory, "build", "treesitter_python.so"), "python"
-)
-
-parser = Parser()
-parser.set_language(PY_LANGUAGE)
+from collections import deque
+from tree_sitter import Node
+from typing import Dict, Generator, Optional, List
+from ..interfaces import AbstractEntityParser, AbstractCodeParser
 
 
 class SequenceParser(AbstractEntityParser):
-    def parse(self, seq_name, *args, **kwargs) -> Optional[dict]:
+    def parse(self, seq_name, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = []
         for node in self._node.children:
-            if entity_node := self._parser.parse_node(node):
+            if entity_node := (yield node):
                 result.append(entity_node)
         return {
             "id": self._parser.get_new_id(),
@@ -31,39 +19,55 @@ class SequenceParser(AbstractEntityParser):
 
 
 class AbstractExpressionParser(AbstractEntityParser):
-    def find_function_calls(self, parent_node) -> Dict:
-        children = [parent_node]
+    def _parse_call(self, node) -> Optional[dict]:
+        """func_call of a call node, None if the callee is not a known function."""
+        name = self._parser.text(node.child_by_field_name("function"))
+        if (func_id := self._parser.find_function_id(name)) is None:
+            return None
+        args = self.parse_func_args(node.child_by_field_name("arguments"))
+        return FunctionCallParser(node, self._parser).parse(func_id, args, name)
+
+    def find_function_calls(self, parent_node, first_only=False) -> List[Dict]:
+        """Breadth-first search for calls of known functions.
+
+        Calls nested in another call are not collected here, they become
+        arguments of the enclosing call, so every node is visited once.
+        """
         result = []
-        while len(children):
-            node = children.pop(0)
+        queue = deque([parent_node])
+        while queue:
+            node = queue.popleft()
             if node.type == "call":
-                name = node.child_by_field_name("function").text.decode("utf-8")
-                args = self.parse_func_args(node.child_by_field_name("arguments"))
-                if function := self._parser.find_function(name)[1]:
-                    result.append(
-                        FunctionCallParser(node, self._parser).parse(
-                            function, args, self._node.text.decode("utf-8")
-                        )
-                    )
-                if node == parent_node:
-                    children.extend(node.children)
-            else:
-                children.extend(node.children)
+                if function_call := self._parse_call(node):
+                    result.append(function_call)
+                    if first_only:
+                        break
+                if node != parent_node:
+                    continue
+            queue.extend(node.children)
         return result
 
     def parse_func_args(self, args) -> List[Dict]:
-        children = [args]
         result = []
-        while len(children):
-            node = children.pop(0)
+        queue = deque([args])
+        while queue:
+            node = queue.popleft()
             if node.type == "call":
-                result.append(self.find_function_calls(node)[0])
-            else:
-                if node.type != "argument_list":
+                # an unknown callee is represented by the first known call
+                # inside it, or by its text if there is none
+                function_calls = self.find_function_calls(node, first_only=True)
+                if function_calls:
+                    result.append(function_calls[0])
+                else:
                     result.append(
-                        {"type": "argument", "name": node.text.decode("utf-8")}
+                        {"type": "argument", "name": self._parser.text(node)}
                     )
-                children.extend(node.named_children)
+                continue
+            if node.type != "argument_list":
+                result.append(
+                    {"type": "argument", "name": self._parser.text(node)}
+                )
+            queue.extend(node.named_children)
         return result
 
 
@@ -85,20 +89,18 @@ class StatementParser(AbstractExpressionParser):
         return {
             "id": self._parser.get_new_id(),
             "type": type,
-            "name": self._node.text.decode("utf-8"),
+            "name": self._parser.text(self._node),
             "func_calls": function_calls,
         }
 
 
 class FunctionCallParser(AbstractEntityParser):
-    def parse(self, function, arguments, call_expr, *args, **kwargs) -> Optional[dict]:
+    def parse(self, func_id, arguments, func_name, *args, **kwargs) -> Optional[dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "func_call",
-            "func_name": self._node.child_by_field_name("function").text.decode(
-                "utf-8"
-            ),
-            "func_id": function["id"],
+            "func_name": func_name,
+            "func_id": func_id,
             "func_args": arguments,
         }
         result["position"] = [
@@ -111,7 +113,7 @@ class FunctionCallParser(AbstractEntityParser):
 
 
 class ConditionParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "alternative",
@@ -120,22 +122,22 @@ class ConditionParser(AbstractEntityParser):
 
         comment_node = self._node.named_children[1]
         if comment_node.type == "comment":
-            result["name"] = comment_node.text.decode("utf-8")[1:].strip()
+            result["name"] = self._parser.text(comment_node)[1:].strip()
 
         alternatives = self._node.children_by_field_name("alternative")
         for alternative in alternatives:
-            result["branches"].append(self._parse_branches(alternative))
+            result["branches"].append((yield from self._parse_branches(alternative)))
         condition = self._node.child_by_field_name("condition")
         result["branches"][0]["cond"] = ExpressionParser(
             condition, self._parser
         ).parse()
         body = self._node.child_by_field_name("consequence")
         for child in body.children:
-            if tree_node := self._parser.parse_node(child):
+            if tree_node := (yield child):
                 result["branches"][0]["body"].append(tree_node)
         return result
 
-    def _parse_branches(self, node) -> Optional[dict]:
+    def _parse_branches(self, node) -> Generator[Node, Optional[dict], dict]:
         result = {"id": self._parser.get_new_id(), "body": []}
         body = None
         if node.type == "elif_clause":
@@ -147,7 +149,7 @@ class ConditionParser(AbstractEntityParser):
             result["type"] = "else"
             body = node.child_by_field_name("body")
         for child in body.children:
-            if tree_node := self._parser.parse_node(child):
+            if tree_node := (yield child):
                 result["body"].append(tree_node)
         return result
 
@@ -157,34 +159,38 @@ class ExpressionParser(AbstractExpressionParser):
         return {
             "id": self._parser.get_new_id(),
             "type": "expr",
-            "name": self._node.text.decode("utf-8"),
+            "name": self._parser.text(self._node),
             "func_calls": self.find_function_calls(self._node),
         }
 
 
 class FunctionParser(AbstractEntityParser):
-    def parse(self) -> Optional[dict]:
+    @staticmethod
+    def function_name(parser, node) -> str:
+        return parser.text(node.child_by_field_name("name"))
+
+    def parse(self) -> Generator[Node, Optional[dict], dict]:
         obj = {
-            "id": self._parser.get_new_id(),
+            "id": self._parser.get_function_id(self._node),
             "type": "func",
-            "name": self._node.child_by_field_name("name").text.decode("utf-8"),
+            "name": self.function_name(self._parser, self._node),
             "param_list": [],
         }
         obj["is_entry"] = obj["name"] == "main"
         params = self._node.child_by_field_name("parameters")
         for param in params.named_children:
-            obj["param_list"].append(param.text.decode("utf-8"))
+            obj["param_list"].append(self._parser.text(param))
         if return_type := self._node.child_by_field_name("return_type"):
-            obj["return_type"] = return_type.text.decode("utf-8")
+            obj["return_type"] = self._parser.text(return_type)
         seq_name = obj["name"] + "-body"
-        obj["body"] = SequenceParser(
+        obj["body"] = yield from SequenceParser(
             self._node.child_by_field_name("body"), self._parser
         ).parse(seq_name)
         return obj
 
 
 class WhileLoopParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = {
             "id": self._parser.get_new_id(),
             "type": "while_loop",
@@ -196,25 +202,25 @@ class WhileLoopParser(AbstractEntityParser):
 
         comment_node = self._node.named_children[1]
         if comment_node.type == "comment":
-            result["name"] = comment_node.text.decode("utf-8")[1:].strip()
+            result["name"] = self._parser.text(comment_node)[1:].strip()
 
         body = self._node.child_by_field_name("body")
-        name = result.get("name", str(result["id"])) + "_loop_body"
-        result["body"] = SequenceParser(body, self._parser).parse(name)
+        name = self._parser.loop_body_name(result)
+        result["body"] = yield from SequenceParser(body, self._parser).parse(name)
 
         return result
 
 
 class ForLoopParser(AbstractEntityParser):
-    def parse(self, *args, **kwargs) -> Optional[dict]:
+    def parse(self, *args, **kwargs) -> Generator[Node, Optional[dict], dict]:
         result = {
             "id": self._parser.get_new_id(),
-            "variable": self._node.child_by_field_name("left").text.decode("utf-8"),
+            "variable": self._parser.text(self._node.child_by_field_name("left")),
             "body": {},
         }
         container = self._node.child_by_field_name("right")
         if container.type == "call":
-            func_name = container.child_by_field_name("function").text.decode("utf-8")
+            func_name = self._parser.text(container.child_by_field_name("function"))
             if func_name == "range":
                 result.update(self._parse_for_loop(container, result["variable"]))
             else:
@@ -224,11 +230,11 @@ class ForLoopParser(AbstractEntityParser):
 
         comment_node = self._node.named_children[2]
         if comment_node.type == "comment":
-            result["name"] = comment_node.text.decode("utf-8")[1:].strip()
+            result["name"] = self._parser.text(comment_node)[1:].strip()
 
         body = self._node.child_by_field_name("body")
-        name = result.get("name", str(result["id"])) + "_loop_body"
-        result["body"] = SequenceParser(body, self._parser).parse(name)
+        name = self._parser.loop_body_name(result)
+        result["body"] = yield from SequenceParser(body, self._parser).parse(name)
 
         return result
 
@@ -240,14 +246,14 @@ class ForLoopParser(AbstractEntityParser):
         stop = None
         step = 1
         if len(arguments.named_children) == 1:
-            stop = arguments.named_children[0].text.decode("utf-8")
+            stop = self._parser.text(arguments.named_children[0])
         elif len(arguments.named_children) == 2:
-            start = arguments.named_children[0].text.decode("utf-8")
-            stop = arguments.named_children[1].text.decode("utf-8")
+            start = self._parser.text(arguments.named_children[0])
+            stop = self._parser.text(arguments.named_children[1])
         else:
-            start = arguments.named_children[0].text.decode("utf-8")
-            stop = arguments.named_children[1].text.decode("utf-8")
-            step = arguments.named_children[2].text.decode("utf-8")
+            start = self._parser.text(arguments.named_children[0])
+            stop = self._parser.text(arguments.named_children[1])
+            step = self._parser.text(arguments.named_children[2])
 
         result["init"] = f"{variable_name}={start}"
         result["cond"] = f"{variable_name}<{stop}"
@@ -260,7 +266,7 @@ class ForLoopParser(AbstractEntityParser):
         return result
 
     def _parse_foreach_loop(self, container_node, variable_name) -> dict:
-        container = container_node.text.decode("utf-8")
+        container = self._parser.text(container_node)
         return {
             "container": container,
             "type": "foreach_loop",
@@ -271,6 +277,7 @@ class ForLoopParser(AbstractEntityParser):
 
 
 class Python2JSONParser(AbstractCodeParser):
+    LANG = "python"
     TYPE_PARSER = {
         "function_definition": FunctionParser,
         "expression_statement": StatementParser,
@@ -282,38 +289,6 @@ class Python2JSONParser(AbstractCodeParser):
         "for_statement": ForLoopParser,
     }
 
-    def __init__(self, code: bytes):
-        self._tree = parser.parse(code)
-        # print(self._tree.root_node.sexp())
-        self._id_counter = 0
-        self._result = {
-            "id": self.get_new_id(),
-            "functions": [],
-            "global_code": {"body": [], "name": "global_code", "type": "sequence"},
-            "name": "algorithm",
-            "type": "algorithm",
-        }
-
-    def parse_node(self, node: Node):
-        entity_parser = self.TYPE_PARSER.get(node.type)
-        if entity_parser:
-            return entity_parser(node, self).parse()
-
-    def parse_all(self):
-        for node in self._tree.root_node.children:
-            if result := self.parse_node(node):
-                if result["type"] == "func":
-                    self._result["functions"].append(result)
-                else:
-                    self._result["global_code"]["body"].append(result)
-        return self._result
-
-    def find_function(self, name: str) -> Tuple[int, Optional[dict]]:
-        for i, function in enumerate(self._result["functions"]):
-            if function["name"] == name:
-                return i, function
-        return -1, None
-
-    def get_new_id(self):
-        self._id_counter += 1
-        return self._id_counter
+    def definition_name(self, node: Node) -> Optional[str]:
+        if node.type == "function_definition":
+            return FunctionParser.function_name(self, node)
@@ -0,0 +1,37 @@
+"""Memory-mapped source files.
+
+A mapped file is read by tree-sitter through its read callback in small
+chunks, and node text is sliced from the mapping, so a parser never holds
+a second full copy of the source next to the page cache.
+"""
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+READ_CHUNK = 64 << 10
+
+Source = Union[bytes, mmap.mmap]
+
+
+@contextmanager
+def open_source(path: str) -> Iterator[Source]:
+    """Map a file read-only for the duration of the block.
+
+    Empty files cannot be mapped and are returned as b"".
+    """
+    with open(path, "rb") as fobj:
+        if os.fstat(fobj.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            yield mapping
+
+
+def reader(source: Source):
+    """Read callback for Parser.parse() serving the source in chunks."""
+
+    def read(byte_offset, point):
+        return source[byte_offset:byte_offset + READ_CHUNK]
+
+    return read
@@ -0,0 +1,114 @@
+"""Directory of cache entries shared between processes, bounded by size.
+
+Every entry is one file named after its key under a subdirectory of the
+first two characters of the key. Files are written to a temporary name and
+renamed into place, so a reader sees either a whole entry or none. Reading
+an entry touches its modification time, and the least recently used
+entries are removed when the directory grows over its limit. Used by the
+parse cache (cache.py) and by the fragment cache of json2html.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+
+def package_digest(directory: str, suffixes: Tuple[str, ...]) -> str:
+    """Digest of the names (relative to ``directory``) and contents of the
+    files with these suffixes under a package directory."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(suffixes):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode())
+                with open(path, "rb") as fobj:
+                    digest.update(fobj.read())
+    return digest.hexdigest()
+
+
+class DiskStore:
+    def __init__(self, directory: str, suffix: str, max_bytes: int):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fobj:
+                data = fobj.read()
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> bool:
+        """Store an entry, False if it could not be written."""
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fobj:
+                fobj.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[0]
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._size = self._evict()
+        return True
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._scan()[1]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def _scan(self):
+        size = 0
+        files = []
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size += stat.st_size
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return size, files
+
+    def _evict(self) -> int:
+        # other processes may share the directory, so look at what is there
+        size, files = self._scan()
+        files.sort()
+        target = self.max_bytes * 3 // 4
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+            self.evictions += 1
+        return size
@@ -0,0 +1,363 @@
+"""Compact in-memory form of the algorithm tree.
+
+NodeTable keeps the tree in a few flat integer arrays instead of nested
+dicts. Every dict of the JSON schema is a row; the fields of a row are a
+contiguous range of field records (key, kind, value, aux) in the order of
+the dict, so converting back gives exactly the dict that was stored.
+Strings are interned into one table, a list of nodes is a range of the
+``child_rows`` array and a list of strings a range of ``string_rows``.
+
+A table is built from a tree with from_tree() or straight from a parser
+with from_parser(), which never holds more than one top-level entry as
+dicts. to_tree() rebuilds dicts, for the whole tree or for one subtree;
+node() gives a read-only mapping view of a row that reads the arrays
+directly, which is what the renderers of json2html work on. All walks use
+an explicit stack, so nesting depth is not limited by the recursion limit.
+
+dumps() and loads() write a table as a MAGIC header, a JSON description
+and the raw arrays, so a renderer can load it without building dicts.
+"""
+import json
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Optional, Union
+
+# field kinds
+INT = 0
+STRING = 1
+NODE = 2
+NODES = 3
+STRINGS = 4
+INTS = 5
+TRUE = 6
+FALSE = 7
+NONE = 8
+OBJECT = 9
+
+_INT_MIN = -(1 << 31)
+_INT_MAX = (1 << 31) - 1
+
+MAGIC = b"C2JT\x01"
+
+_ARRAYS = (
+    "field_start", "field_count", "field_key", "field_kind", "field_value",
+    "field_aux", "child_rows", "string_rows", "int_rows",
+)
+
+
+class NodeTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._string_index = {}
+        # per row: range of field records
+        self.field_start = array("i")
+        self.field_count = array("i")
+        # per field record
+        self.field_key = array("i")
+        self.field_kind = array("b")
+        self.field_value = array("i")
+        self.field_aux = array("i")
+        # ranges referenced by NODES, STRINGS and INTS fields
+        self.child_rows = array("i")
+        self.string_rows = array("i")
+        self.int_rows = array("i")
+        # values that fit no other kind (floats, nested lists, big ints)
+        self.objects: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.field_start)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays, without the interned strings."""
+        return sum(len(a) * a.itemsize for a in self._arrays())
+
+    def _arrays(self) -> List[array]:
+        return [getattr(self, name) for name in _ARRAYS]
+
+    def intern(self, string: str) -> int:
+        index = self._string_index.get(string)
+        if index is None:
+            index = self._string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    # building
+
+    @classmethod
+    def from_tree(cls, tree: dict) -> "NodeTable":
+        table = cls()
+        table.add(tree)
+        return table
+
+    @classmethod
+    def from_parser(cls, parser) -> "NodeTable":
+        """Fill a table from parser.iter_parse(), one top-level entry at a time."""
+        table = cls()
+        # the root is looked up as row 0
+        root = table._new_row()
+        functions = _Rows()
+        global_code = _Rows()
+        for result in parser.iter_parse():
+            row = table.add(result)
+            (functions if result["type"] == "func" else global_code).append(row)
+        table.add(parser.document(functions, global_code), root)
+        return table
+
+    def add(self, tree: dict, row: Optional[int] = None) -> int:
+        """Append a dict and everything below it, return its row.
+
+        ``row`` is a row reserved earlier with _new_row() to fill instead.
+        """
+        root = self._new_row() if row is None else row
+        stack = [(root, tree)]
+        while stack:
+            row, node = stack.pop()
+            self.field_start[row] = len(self.field_key)
+            self.field_count[row] = len(node)
+            pending = []
+            for key, value in node.items():
+                kind, first, aux = self._field(value, pending)
+                self.field_key.append(self.intern(key))
+                self.field_kind.append(kind)
+                self.field_value.append(first)
+                self.field_aux.append(aux)
+            stack.extend(reversed(pending))
+        return root
+
+    def _new_row(self) -> int:
+        self.field_start.append(0)
+        self.field_count.append(0)
+        return len(self.field_start) - 1
+
+    def _field(self, value, pending):
+        if value is True:
+            return TRUE, 0, 0
+        if value is False:
+            return FALSE, 0, 0
+        if value is None:
+            return NONE, 0, 0
+        if isinstance(value, int) and _INT_MIN <= value <= _INT_MAX:
+            return INT, value, 0
+        if isinstance(value, str):
+            return STRING, self.intern(value), 0
+        if isinstance(value, dict):
+            row = self._new_row()
+            pending.append((row, value))
+            return NODE, row, 0
+        if isinstance(value, _Rows):
+            start = len(self.child_rows)
+            self.child_rows.extend(value)
+            return NODES, start, len(value)
+        if isinstance(value, list):
+            if all(isinstance(item, dict) for item in value):
+                start = len(self.child_rows)
+                for item in value:
+                    row = self._new_row()
+                    self.child_rows.append(row)
+                    pending.append((row, item))
+                return NODES, start, len(value)
+            if all(isinstance(item, str) for item in value):
+                start = len(self.string_rows)
+                self.string_rows.extend(self.intern(item) for item in value)
+                return STRINGS, start, len(value)
+            if all(
+                type(item) is int and _INT_MIN <= item <= _INT_MAX for item in value
+            ):
+                start = len(self.int_rows)
+                self.int_rows.extend(value)
+                return INTS, start, len(value)
+        self.objects.append(value)
+        return OBJECT, len(self.objects) - 1, 0
+
+    # reading
+
+    def _find(self, row: int, key: str) -> int:
+        code = self._string_index.get(key)
+        start = self.field_start[row]
+        for i in range(start, start + self.field_count[row]):
+            if self.field_key[i] == code:
+                return i
+        return -1
+
+    def _value(self, i: int):
+        kind = self.field_kind[i]
+        value = self.field_value[i]
+        if kind == INT:
+            return value
+        if kind == STRING:
+            return self.strings[value]
+        if kind == NODE:
+            return value
+        if kind == NODES:
+            return self.child_rows[value:value + self.field_aux[i]].tolist()
+        if kind == STRINGS:
+            return [self.strings[s] for s in self.string_rows[value:value + self.field_aux[i]]]
+        if kind == INTS:
+            return self.int_rows[value:value + self.field_aux[i]].tolist()
+        if kind == OBJECT:
+            return self.objects[value]
+        return {TRUE: True, FALSE: False, NONE: None}[kind]
+
+    def get(self, row: int, key: str, default=None):
+        """Value of a field; nodes are returned as rows, lists of nodes as lists of rows."""
+        i = self._find(row, key)
+        return default if i < 0 else self._value(i)
+
+    def type(self, row: int) -> Optional[str]:
+        return self.get(row, "type")
+
+    def name(self, row: int) -> Optional[str]:
+        return self.get(row, "name")
+
+    def children(self, row: int, key: str) -> range:
+        """Positions in child_rows of a list of nodes (empty if there is none)."""
+        i = self._find(row, key)
+        if i < 0 or self.field_kind[i] != NODES:
+            return range(0)
+        start = self.field_value[i]
+        return range(start, start + self.field_aux[i])
+
+    def functions(self) -> Iterator[int]:
+        """Rows of the top-level functions."""
+        for i in self.children(0, "functions"):
+            yield self.child_rows[i]
+
+    def global_statements(self) -> Iterator[int]:
+        """Rows of the global code statements."""
+        global_code = self.get(0, "global_code")
+        if global_code is not None:
+            for i in self.children(global_code, "body"):
+                yield self.child_rows[i]
+
+    def node(self, row: int = 0) -> "TableNode":
+        """Read-only mapping view of a row, see TableNode."""
+        return TableNode(self, row)
+
+    def to_tree(self, row: int = 0) -> dict:
+        """Rebuild the dict of a row and everything below it."""
+        result = {}
+        stack = [(row, result)]
+        while stack:
+            row, node = stack.pop()
+            start = self.field_start[row]
+            for i in range(start, start + self.field_count[row]):
+                key = self.strings[self.field_key[i]]
+                kind = self.field_kind[i]
+                if kind == NODE:
+                    child = node[key] = {}
+                    stack.append((self.field_value[i], child))
+                elif kind == NODES:
+                    items = node[key] = []
+                    first = self.field_value[i]
+                    for child_row in self.child_rows[first:first + self.field_aux[i]]:
+                        child = {}
+                        items.append(child)
+                        stack.append((child_row, child))
+                else:
+                    node[key] = self._value(i)
+        return result
+
+    # serialization
+
+    def dumps(self) -> bytes:
+        header = json.dumps(
+            {
+                "byteorder": sys.byteorder,
+                "strings": self.strings,
+                "objects": self.objects,
+                "arrays": [[a.typecode, len(a)] for a in self._arrays()],
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        parts = [MAGIC, struct.pack("<Q", len(header)), header]
+        parts.extend(a.tobytes() for a in self._arrays())
+        return b"".join(parts)
+
+    @classmethod
+    def loads(cls, data: Union[bytes, bytearray, memoryview]) -> "NodeTable":
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a node table")
+        offset = len(MAGIC)
+        (header_size,) = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        header = json.loads(bytes(data[offset:offset + header_size]).decode("utf-8"))
+        offset += header_size
+        table = cls()
+        table.strings = header["strings"]
+        table._string_index = {string: i for i, string in enumerate(table.strings)}
+        table.objects = header["objects"]
+        for name, (typecode, length) in zip(_ARRAYS, header["arrays"]):
+            values = array(typecode)
+            end = offset + length * values.itemsize
+            values.frombytes(data[offset:end])
+            if header["byteorder"] != sys.byteorder:
+                values.byteswap()
+            setattr(table, name, values)
+            offset = end
+        return table
+
+
+def is_table(data) -> bool:
+    """True if serialized data is a table written by NodeTable.dumps()."""
+    return isinstance(data, (bytes, bytearray)) and data[:len(MAGIC)] == MAGIC
+
+
+class TableNode(Mapping):
+    """A row of a NodeTable as a read-only mapping.
+
+    Values are read from the arrays on access: a nested node is another
+    view and a list of nodes a list of views, so a subtree is never copied
+    into dicts. The field positions of the row are looked up once, on the
+    first access, so every access after that is a dict lookup. str() and
+    repr() are those of the equivalent dict.
+    """
+
+    __slots__ = ("_table", "_row", "_fields")
+
+    def __init__(self, table: NodeTable, row: int):
+        self._table = table
+        self._row = row
+        self._fields = None
+
+    def _index(self) -> dict:
+        if self._fields is None:
+            table = self._table
+            start = table.field_start[self._row]
+            self._fields = {
+                table.strings[table.field_key[i]]: i
+                for i in range(start, start + table.field_count[self._row])
+            }
+        return self._fields
+
+    def __getitem__(self, key: str):
+        i = self._index()[key]
+        table = self._table
+        kind = table.field_kind[i]
+        if kind == NODE:
+            return TableNode(table, table.field_value[i])
+        if kind == NODES:
+            return [TableNode(table, row) for row in table._value(i)]
+        return table._value(i)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index())
+
+    def __len__(self) -> int:
+        return self._table.field_count[self._row]
+
+    def to_tree(self) -> dict:
+        return self._table.to_tree(self._row)
+
+    def __repr__(self) -> str:
+        return repr(self.to_tree())
+
+
+class _Rows(list):
+    """Rows that are already in the table (used by from_parser)."""
@@ -0,0 +1 @@
+"""Algorithm JSON tree to HTML compiler."""
@@ -1,10 +1,21 @@
-from jinja2 import FileSystemLoader, Environment
+from jinja2 import FileSystemLoader, FileSystemBytecodeCache, Environment
 import os
-from utils import Tab, html_quote_escape
-from interfaces import AbstractEntityRenderer
+import uuid
+from typing import Iterator, Optional, Union
+from code2json.compact import load_tree
+from code2json.table import NodeTable, is_table
+from .utils import Fragments, Tab, html_quote_escape, join_fragments
+from .interfaces import AbstractBlockRenderer, AbstractEntityRenderer, RenderRequests
+from .instrumentation import Instrumentation
+from .cache import FragmentCache
+from .parallel import make_executor, render_functions
 
 
-class AlternativeRenderer(AbstractEntityRenderer):
+def _request(renderer, tabs) -> RenderRequests:
+    return (yield renderer, tabs)
+
+
+class AlternativeRenderer(AbstractBlockRenderer):
     PHASE_LABEL_PLAY = "Начнётся"
     PHASE_LABEL_STOP = "Закончится"
     PHASE_EXPR_LABEL_PLAY = "Выполнится"
@@ -17,11 +28,12 @@ class AlternativeRenderer(AbstractEntityRenderer):
     ACT_NAME_EXPR_TEMPLATE = "условие `{}`"
     ACT_NAME_ELSE_TEMPLATE = "ветка `иначе`"
 
-    def render_html(self, *args, **kwargs) -> str:
+    def iter_fragments(self, *args, **kwargs) -> RenderRequests:
         with_buttons = kwargs.get("with_buttons", True)
         tabs = kwargs.get("tabs", "")
         template = self._ancestor.get_template(self._node["type"])
-        
+        bodies = self._ancestor.fragments()
+
         branches = {
             "if": {
                 "id": self._node["branches"][0]["id"],
@@ -30,11 +42,9 @@ class AlternativeRenderer(AbstractEntityRenderer):
                     tabs=tabs,
                     with_buttons=with_buttons,
                 ),
-                "body": self._ancestor.render_nodes(
-                    self._node["branches"][0]["body"],
-                    tabs=tabs.up(),
-                    with_buttons=with_buttons,
-                ),
+                "body": bodies.add((yield from self._ancestor.iter_render(
+                    self._node["branches"][0]["body"], tabs.up(), with_buttons
+                ))),
                 "expr_id": self._node["branches"][0]["cond"]["id"],
                 "expr_act_type_play": self.ACT_TYPE_EXPR_PLAY,
                 "expr_phase_label_play": self.PHASE_EXPR_LABEL_PLAY,
@@ -54,9 +64,9 @@ class AlternativeRenderer(AbstractEntityRenderer):
         for branch in self._node["branches"][1:]:
             if branch["type"] == "else":
                 branches["else"] = {
-                    "body": self._ancestor.render_nodes(
-                        branch["body"], tabs=tabs.up(), with_buttons=with_buttons
-                    ),
+                    "body": bodies.add((yield from self._ancestor.iter_render(
+                        branch["body"], tabs.up(), with_buttons
+                    ))),
                     "act_type_play": self.ACT_TYPE_PLAY,
                     "phase_label_play": self.PHASE_LABEL_PLAY,
                     "act_play_name": self.ACT_NAME_ELSE_TEMPLATE,
@@ -67,9 +77,9 @@ class AlternativeRenderer(AbstractEntityRenderer):
                     {
                         "id": branch["id"],
                         "condition": branch["cond"]["name"],
-                        "body": self._ancestor.render_nodes(
-                            branch["body"], tabs=tabs.up(), with_buttons=with_buttons
-                        ),
+                        "body": bodies.add((yield from self._ancestor.iter_render(
+                            branch["body"], tabs.up(), with_buttons
+                        ))),
                         "expr_id": branch["cond"]["id"],
                         "expr_act_type_play": self.ACT_TYPE_EXPR_PLAY,
                         "expr_phase_label_play": self.PHASE_EXPR_LABEL_PLAY,
@@ -84,7 +94,7 @@ class AlternativeRenderer(AbstractEntityRenderer):
                         "phase_label_stop": self.PHASE_LABEL_STOP,
                     }
                 )
-        return template.render(
+        return bodies.splice(template.render(
             {
                 "with_buttons": kwargs.get("with_buttons", True),
                 "id": self._node["id"],
@@ -98,20 +108,21 @@ class AlternativeRenderer(AbstractEntityRenderer):
                 "name": self._node.get("name"),
                 "phase_label_stop": self.PHASE_LABEL_STOP,
             }
-        )
+        ))
 
 
-class ForLoopRenderer(AbstractEntityRenderer):
+class ForLoopRenderer(AbstractBlockRenderer):
     PHASE_LABEL_PLAY = "Начнётся"
     PHASE_LABEL_STOP = "Закончится"
     ACT_TYPE_PLAY = "started"
     ACT_NAME_TEMPLATE = "цикл `{}`"
     ACT_ITER_NAME_TEMPLATE = "итерация цикла `{}`"
 
-    def render_html(self, *args, **kwargs) -> str:
+    def iter_fragments(self, *args, **kwargs) -> RenderRequests:
         with_buttons = kwargs.get("with_buttons", True)
         tabs = kwargs.get("tabs", "")
         template = self._ancestor.get_template(self._node["type"])
+        bodies = self._ancestor.fragments()
         if self._node["type"] == "for_loop":
             if "start" in self._node:
                 start = self._node.get("start")
@@ -131,7 +142,7 @@ class ForLoopRenderer(AbstractEntityRenderer):
         else:
             extend = {"container": self._node["container"]}
         extend["variable"] = self._node.get("variable", "")
-        return template.render(
+        return bodies.splice(template.render(
             {
                 "with_buttons": kwargs.get("with_buttons", True),
                 "id": self._node["id"],
@@ -147,17 +158,15 @@ class ForLoopRenderer(AbstractEntityRenderer):
                     html_quote_escape(self._node.get("name", ""))
                 ),
                 "name": self._node.get("name", ""),
-                "loop_body": self._ancestor.render_nodes(
-                    self._node["body"]["body"],
-                    tabs=tabs.up(),
-                    with_buttons=with_buttons,
-                ),
+                "loop_body": bodies.add((yield from self._ancestor.iter_render(
+                    self._node["body"]["body"], tabs.up(), with_buttons
+                ))),
                 **extend,
             }
-        )
+        ))
 
 
-class WhileLoopRenderer(AbstractEntityRenderer):
+class WhileLoopRenderer(AbstractBlockRenderer):
     PHASE_LABEL_PLAY = "Начнётся"
     PHASE_LABEL_STOP = "Закончится"
     ACT_TYPE_PLAY = "started"
@@ -167,11 +176,12 @@ class WhileLoopRenderer(AbstractEntityRenderer):
     ACT_TYPE_EXPR_PLAY = "performed"
     PHASE_EXPR_LABEL_PLAY = "Выполнится"
 
-    def render_html(self, *args, **kwargs) -> str:
+    def iter_fragments(self, *args, **kwargs) -> RenderRequests:
         tabs = kwargs.get("tabs", "")
         with_buttons = kwargs.get("with_buttons", True)
         template = self._ancestor.get_template(self._node["type"])
-        return template.render(
+        bodies = self._ancestor.fragments()
+        return bodies.splice(template.render(
             {
                 "with_buttons": kwargs.get("with_buttons", True),
                 "id": self._node["id"],
@@ -187,11 +197,9 @@ class WhileLoopRenderer(AbstractEntityRenderer):
                     html_quote_escape(self._node.get("name", ""))
                 ),
                 "name": self._node.get("name", ""),
-                "loop_body": self._ancestor.render_nodes(
-                    self._node["body"]["body"],
-                    tabs=tabs.up(),
-                    with_buttons=with_buttons,
-                ),
+                "loop_body": bodies.add((yield from self._ancestor.iter_render(
+                    self._node["body"]["body"], tabs.up(), with_buttons
+                ))),
                 "condition": self._node["cond"]["name"],
                 "expr_id": self._node["cond"]["id"],
                 "expr_act_type_play": self.ACT_TYPE_EXPR_PLAY,
@@ -200,7 +208,7 @@ class WhileLoopRenderer(AbstractEntityRenderer):
                     html_quote_escape(self._node["cond"]["name"])
                 ),
             }
-        )
+        ))
 
 
 class StatementRenderer(AbstractEntityRenderer):
@@ -247,7 +255,7 @@ class StatementRenderer(AbstractEntityRenderer):
 
     def form_stmt(self, with_buttons):
         stmt = self._node["name"]
-        new_stmt = ""
+        parts = []
         func_calls = self._node["func_calls"]
         func_calls.sort(key=lambda x: x["position"][0])
         func_call_template = self._ancestor.get_template("func_call")
@@ -275,10 +283,11 @@ class StatementRenderer(AbstractEntityRenderer):
             if i + 1 < len(func_calls):
                 next_start = func_calls[i + 1]["position"][0]
                 next_end = func_calls[i + 1]["position"][1]
-                new_stmt += stmt[prev_end:start] + text + stmt[end:next_start]
+                parts += (stmt[prev_end:start], text, stmt[end:next_start])
                 prev_end = next_start
             else:
-                new_stmt += stmt[prev_end:start] + text + stmt[end : len(stmt)]
+                parts += (stmt[prev_end:start], text, stmt[end : len(stmt)])
+        new_stmt = "".join(parts)
         if not new_stmt:
             new_stmt = stmt
         return new_stmt
@@ -320,21 +329,22 @@ class ExpressionRenderer(StatementRenderer):
     }
 
 
-class FunctionRenderer(AbstractEntityRenderer):
+class FunctionRenderer(AbstractBlockRenderer):
     PHASE_LABEL_PLAY = "Выполнится"
     PHASE_LABEL_STOP = "Завершится"
     ACT_TYPE = "started"
     ACT_NAME = "выполнение тела функции {}"
 
-    def render_html(self, *args, **kwargs) -> str:
+    def iter_fragments(self, *args, **kwargs) -> RenderRequests:
         with_buttons = kwargs.get("with_buttons", True)
         arguments = "(" + ", ".join(self._node["param_list"]) + ")"
         tabs = kwargs.get("tabs", "")
         template = self._ancestor.get_template(self._node["type"])
-        body_html = self._ancestor.render_nodes(
-            self._node["body"]["body"], tabs=tabs.up(), with_buttons=with_buttons
-        )
-        return template.render(
+        bodies = self._ancestor.fragments()
+        body_html = bodies.add((yield from self._ancestor.iter_render(
+            self._node["body"]["body"], tabs.up(), with_buttons
+        )))
+        return bodies.splice(template.render(
             {
                 "with_buttons": kwargs.get("with_buttons", True),
                 "id": self._node["id"],
@@ -349,7 +359,7 @@ class FunctionRenderer(AbstractEntityRenderer):
                 "phase_label_stop": self.PHASE_LABEL_STOP,
                 "act_iter_name": self.ACT_NAME.format(self._node["name"]),
             }
-        )
+        ))
 
 
 class JSON2HtmlBuilder:
@@ -382,55 +392,267 @@ class JSON2HtmlBuilder:
         "while_loop": WhileLoopRenderer,
     }
 
-    def __init__(self, lang):
+    # templates that only define macros; they are evaluated once and their
+    # macros become globals of every template instead of being imported on
+    # each render
+    macro_libraries = (
+        "utils/button_play.html",
+        "utils/button_stop.html",
+        "utils/button_stepinto.html",
+        "utils/button_stepout.html",
+        "utils/tabs.html",
+        "{lang}/block_body.html",
+        "{lang}/comment.html",
+    )
+
+    def __init__(
+        self,
+        lang,
+        instrumentation: Optional[Instrumentation] = None,
+        bytecode_cache: Optional[str] = None,
+        fragment_cache: Optional[FragmentCache] = None,
+        jobs: int = 1,
+    ):
+        """``bytecode_cache`` is a directory where compiled templates are kept
+        between processes, so a fresh process does not parse them again.
+        ``fragment_cache`` reuses the HTML of unchanged functions and global
+        statements between builds. With ``jobs`` > 1 functions are rendered
+        over a pool of that many processes, started on the first build and
+        kept until close(); instrumentation then only sees the global code."""
         directory = os.path.dirname(__file__)
         self.lang = lang
         file_loader = FileSystemLoader(os.path.join(directory, "templates"))
-        self.env = Environment(loader=file_loader, trim_blocks=True)
+        self._bytecode_cache_dir = bytecode_cache
+        if bytecode_cache:
+            os.makedirs(bytecode_cache, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache)
+        # templates are part of the package: do not stat them on every lookup
+        self.env = Environment(
+            loader=file_loader,
+            trim_blocks=True,
+            auto_reload=False,
+            bytecode_cache=bytecode_cache,
+        )
+        for library in self.macro_libraries:
+            module = self.env.get_template(library.format(lang=lang)).module
+            self.env.globals.update(
+                (name, macro) for name, macro in vars(module).items()
+                if not name.startswith("_")
+            )
+        self.instrumentation = instrumentation
+        self.fragment_cache = fragment_cache
+        self.jobs = jobs
+        self._executor = None
+        self._templates = {}
+        # unguessable, so that source text cannot fake a fragment placeholder
+        self._marker = "\x00%s\x00" % uuid.uuid4().hex
 
     def get_template(self, node_type):
-        ###
-        print('get_template:', node_type)
-        ###
-        return self.env.get_template(
-            f"{self.lang}/{self.type2template[node_type]}.html"
+        template = self._templates.get(node_type)
+        if self.instrumentation is not None:
+            self.instrumentation.template(node_type, template is not None)
+        if template is None:
+            template = self._templates[node_type] = self.env.get_template(
+                f"{self.lang}/{self.type2template[node_type]}.html"
+            )
+        return template
+
+    def preload(self):
+        """Compile the templates of all node types of the language ahead of the first build."""
+        # not every language has every node type (C has no foreach_loop)
+        available = set(
+            self.env.list_templates(filter_func=lambda name: name.startswith(self.lang + "/"))
         )
+        for node_type, template in self.type2template.items():
+            if f"{self.lang}/{template}.html" in available:
+                self.get_template(node_type)
 
     def get_renderer(self, node) -> AbstractEntityRenderer:
-        ###
-        print('get_renderer:', node["type"])
-        ###
+        if self.instrumentation is not None:
+            self.instrumentation.node(node["type"])
         if renderer := self.type2renderer.get(node["type"]):
             return renderer(node, self)
 
+    def close(self):
+        """Stop the worker processes of parallel rendering, if any."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = make_executor(self.lang, self.jobs, self._bytecode_cache_dir)
+        return self._executor
+
+    def fragments(self) -> Fragments:
+        return Fragments(self._marker)
+
+    def run_renderer(self, renderer, tabs, with_buttons) -> list:
+        """Fragment list of one renderer, with block bodies rendered from a stack."""
+        return self._drive(_request(renderer, tabs), with_buttons)
+
+    def _drive(self, requests: RenderRequests, with_buttons) -> list:
+        """Answer render requests with an explicit stack instead of recursion.
+
+        ``requests`` is a generator yielding (renderer, tabs) pairs and sent
+        the fragment list of each. Block renderers are such generators
+        themselves (AbstractBlockRenderer.iter_fragments) and are pushed on
+        the stack, so the nesting depth of the tree is not limited by the
+        recursion limit. Returns what ``requests`` returns.
+        """
+        instrumentation = self.instrumentation
+        stack = [(requests, None)]
+        value = None
+        try:
+            while True:
+                try:
+                    renderer, tabs = stack[-1][0].send(value)
+                except StopIteration as stop:
+                    _, renderer_class = stack.pop()
+                    if renderer_class is not None and instrumentation is not None:
+                        instrumentation.leave(renderer_class)
+                    if not stack:
+                        return stop.value
+                    value = stop.value
+                    continue
+                if instrumentation is not None:
+                    instrumentation.enter(type(renderer))
+                if isinstance(renderer, AbstractBlockRenderer):
+                    generator = renderer.iter_fragments(tabs=tabs, with_buttons=with_buttons)
+                    stack.append((generator, type(renderer)))
+                    value = None
+                else:
+                    try:
+                        value = renderer.render_fragments(tabs=tabs, with_buttons=with_buttons)
+                    finally:
+                        if instrumentation is not None:
+                            instrumentation.leave(type(renderer))
+        finally:
+            # a renderer raised: leave every block still open, innermost first
+            while stack:
+                generator, renderer_class = stack.pop()
+                generator.close()
+                if renderer_class is not None and instrumentation is not None:
+                    instrumentation.leave(renderer_class)
+
+    def _render_top(self, node, tabs, with_buttons) -> Optional[list]:
+        """Render a function or a global statement, through the fragment cache if any."""
+        if self.fragment_cache is None:
+            if renderer := self.get_renderer(node):
+                return self.run_renderer(renderer, tabs, with_buttons)
+            return None
+        # the key is taken before rendering: renderers may reorder func_calls
+        key = self.fragment_cache.key(node, self.lang, tabs, with_buttons)
+        html = self.fragment_cache.get(key)
+        if html is None:
+            renderer = self.get_renderer(node)
+            if renderer is None:
+                return None
+            html = join_fragments(self.run_renderer(renderer, tabs, with_buttons))
+            self.fragment_cache.put(key, html)
+        return [html]
+
+    def render_top_level(self, node, with_buttons=True) -> Optional[str]:
+        """HTML of a function or a global statement, None if it has no renderer."""
+        fragments = self._render_top(node, Tab(0), with_buttons)
+        return None if fragments is None else join_fragments(fragments)
+
     def render_node(self, node, tabs=Tab(0), with_buttons=True) -> str:
         html = ""
         if renderer := self.get_renderer(node):
-            html = renderer.render_html(tabs=tabs, with_buttons=with_buttons)
+            html = join_fragments(self.run_renderer(renderer, tabs, with_buttons))
         return html
 
-    def render_nodes(self, nodes, tabs=Tab(0), with_buttons=True) -> str:
-        html = ""
+    def iter_render(self, nodes, tabs, with_buttons) -> RenderRequests:
+        """Render requests for a list of nodes, see _drive()."""
+        fragments = []
         for element in nodes:
             if renderer := self.get_renderer(element):
-                html += renderer.render_html(tabs=tabs, with_buttons=with_buttons)
-        return html
+                fragments.append((yield renderer, tabs))
+        return fragments
 
-    def build(self, obj: dict, with_buttons=True) -> str:
-        functions = []
-        # tabs = Tab(0)
+    def render_fragments(self, nodes, tabs=Tab(0), with_buttons=True) -> list:
+        """Render nodes into a nested fragment list, see utils.Fragments."""
+        return self._drive(self.iter_render(nodes, tabs, with_buttons), with_buttons)
+
+    def render_nodes(self, nodes, tabs=Tab(0), with_buttons=True) -> str:
+        return join_fragments(self.render_fragments(nodes, tabs, with_buttons))
+
+    def build(self, obj: Union[dict, NodeTable, bytes, str], with_buttons=True) -> str:
+        return "".join(self.iter_build(obj, with_buttons=with_buttons))
+
+    def iter_build(
+        self, obj: Union[dict, NodeTable, bytes, str], with_buttons=True
+    ) -> Iterator[str]:
+        """Yield the document in chunks as it is rendered.
+
+        The header comes first, then every function as soon as it is
+        rendered, then every global statement and the styles, so at most one
+        top-level node is held in memory at a time. A NodeTable (or a
+        serialized one) is rendered from views of its rows; only subtrees
+        that go through the fragment cache or to worker processes are turned
+        into dicts.
+        """
+        if is_table(obj):
+            obj = NodeTable.loads(obj)
+        if isinstance(obj, NodeTable):
+            view = obj.to_tree if self.fragment_cache is not None else obj.node
+            function_count = len(obj.children(0, "functions"))
+            if self.jobs > 1 and function_count > 1:
+                function_nodes = (obj.to_tree(row) for row in obj.functions())
+            else:
+                function_nodes = (view(row) for row in obj.functions())
+            global_nodes = (view(row) for row in obj.global_statements())
+        else:
+            if not isinstance(obj, dict):
+                # JSON text or the compact binary encoding
+                obj = load_tree(obj)
+            function_count = len(obj["functions"])
+            function_nodes = obj["functions"]
+            global_nodes = obj["global_code"]["body"]
+        bodies = self.fragments()
         tabs = Tab(0)
-        for function in obj["functions"]:
-            if renderer := self.get_renderer(function):
-                functions.append(
-                    renderer.render_html(tabs=tabs, with_buttons=with_buttons)
-                )
-        global_html = self.render_nodes(
-            obj["global_code"]["body"], tabs=tabs, with_buttons=with_buttons
-        )
-        ###
-        # print(functions)
-        ###
-        return self.env.get_template("document.html").render(
-            {"global_code": global_html, "functions": functions}
-        )
+
+        def functions():
+            if self.jobs > 1 and function_count > 1:
+                for html in render_functions(
+                    self._get_executor(),
+                    function_nodes,
+                    function_count,
+                    with_buttons,
+                    self.jobs,
+                    self.lang,
+                    self.fragment_cache,
+                ):
+                    if html is not None:
+                        yield bodies.add([html])
+                return
+            for function in function_nodes:
+                if (fragments := self._render_top(function, tabs, with_buttons)) is not None:
+                    yield bodies.add(fragments)
+
+        def global_code():
+            for element in global_nodes:
+                if (fragments := self._render_top(element, tabs, with_buttons)) is not None:
+                    yield fragments
+
+        template = self.env.get_template("document.html")
+        for chunk in template.generate(
+            {"global_code": bodies.defer(global_code()), "functions": functions()}
+        ):
+            for piece in bodies.splice(chunk, release=True):
+                if isinstance(piece, str):
+                    if piece:
+                        yield piece
+                elif isinstance(piece, list):
+                    yield join_fragments(piece)
+                else:
+                    # deferred global code, rendered statement by statement
+                    for fragments in piece:
+                        yield join_fragments(fragments)
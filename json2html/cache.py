@@ -0,0 +1,118 @@
+"""Cache of rendered top-level fragments (functions and global statements).
+
+A fragment is keyed by a hash of its subtree together with the language,
+the tab level and ``with_buttons``, and the key is salted with a digest of
+the templates and renderers, so a changed template never serves stale
+HTML. Re-rendering a document where one function changed then only
+renders that function.
+
+The memory tier is an LRU bounded by the size of the cached strings. The
+optional disk tier keeps one file per fragment in a directory that several
+processes may share (see code2json/store.py).
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from code2json.store import DiskStore, package_digest
+from .utils import Tab
+
+DEFAULT_MAX_BYTES = 64 << 20
+DEFAULT_DISK_MAX_BYTES = 512 << 20
+
+
+@lru_cache(maxsize=None)
+def code_digest() -> str:
+    """Digest of everything besides the subtree that shapes a fragment:
+    the modules of the package and the templates."""
+    return package_digest(os.path.dirname(os.path.abspath(__file__)), (".py", ".html"))
+
+
+class FragmentCache:
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        directory: Optional[str] = None,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._disk = DiskStore(directory, ".html", disk_max_bytes) if directory else None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, node: dict, lang: str, tabs: Tab, with_buttons: bool) -> str:
+        digest = hashlib.sha1(code_digest().encode())
+        digest.update(
+            json.dumps(
+                [lang, tabs.level, tabs.whitespaces, bool(with_buttons), node],
+                ensure_ascii=False,
+                sort_keys=True,
+                separators=(",", ":"),
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+        data = self._disk.get(key) if self._disk is not None else None
+        html = None if data is None else data.decode("utf-8")
+        with self._lock:
+            if html is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, html)
+        return html
+
+    def put(self, key: str, html: str):
+        with self._lock:
+            self._memory_put(key, html)
+        if self._disk is not None:
+            self._disk.put(key, html.encode("utf-8"))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions + (self._disk.evictions if self._disk is not None else 0),
+            }
+
+    def _memory_put(self, key: str, html: str):
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= sys.getsizeof(old)
+        self._entries[key] = html
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= sys.getsizeof(evicted)
+            self.evictions += 1
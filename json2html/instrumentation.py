@@ -0,0 +1,80 @@
+"""Optional instrumentation of JSON2HtmlBuilder.
+
+A builder reports to its ``instrumentation`` object, which is None by
+default, so an uninstrumented build only pays for a few ``is None``
+checks. Any object with the methods of Instrumentation can be plugged in;
+RenderStats is the one shipped here and collects counters that can be
+exported as JSON.
+"""
+import json
+import time
+from collections import Counter, defaultdict
+
+
+class Instrumentation:
+    """Receives events of a build. All hooks do nothing by default."""
+
+    def node(self, node_type: str):
+        """A node of this type is about to be rendered."""
+
+    def template(self, node_type: str, hit: bool):
+        """The template of a node type was requested; ``hit`` tells if it was already loaded."""
+
+    def enter(self, renderer_class: type):
+        """A renderer starts render_html()."""
+
+    def leave(self, renderer_class: type):
+        """The last entered renderer has finished."""
+
+
+class RenderStats(Instrumentation):
+    """Per-node-type counts, render time per renderer class and template cache hits.
+
+    Render time is measured twice: ``total`` includes the nested nodes a
+    renderer renders (a function includes its whole body), ``self`` excludes
+    them, so the ``self`` times of all classes add up to the build time.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._stack = []
+        self.node_counts = Counter()
+        self.total_time = defaultdict(float)
+        self.self_time = defaultdict(float)
+        self.template_hits = 0
+        self.template_misses = 0
+
+    def node(self, node_type: str):
+        self.node_counts[node_type] += 1
+
+    def template(self, node_type: str, hit: bool):
+        if hit:
+            self.template_hits += 1
+        else:
+            self.template_misses += 1
+
+    def enter(self, renderer_class: type):
+        # [start time, time spent in nested renderers]
+        self._stack.append([self._clock(), 0.0])
+
+    def leave(self, renderer_class: type):
+        start, nested = self._stack.pop()
+        elapsed = self._clock() - start
+        name = renderer_class.__name__
+        self.total_time[name] += elapsed
+        self.self_time[name] += elapsed - nested
+        if self._stack:
+            self._stack[-1][1] += elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes": dict(self.node_counts),
+            "renderers": {
+                name: {"total": self.total_time[name], "self": self.self_time[name]}
+                for name in self.total_time
+            },
+            "templates": {"hits": self.template_hits, "misses": self.template_misses},
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
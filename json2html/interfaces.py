@@ -1,11 +1,46 @@
 from abc import ABC, abstractmethod
+from typing import Generator, Mapping, Tuple
+
+from .utils import Tab, join_fragments
+
+# yields (renderer, tabs) requests, is sent the fragment list of each and
+# returns its own fragment list
+RenderRequests = Generator[Tuple["AbstractEntityRenderer", Tab], list, list]
 
 
 class AbstractEntityRenderer(ABC):
     def __init__(self, tree_node, ancestor):
-        self._node: dict = tree_node
+        self._node: Mapping = tree_node
         self._ancestor: "JSON2HtmlBuilder" = ancestor
 
     @abstractmethod
     def render_html(self, *args, **kwargs) -> str:
         pass
+
+    def render_fragments(self, *args, **kwargs) -> list:
+        """Rendered HTML as a nested fragment list (see utils.iter_fragments)."""
+        return [self.render_html(*args, **kwargs)]
+
+
+class AbstractBlockRenderer(AbstractEntityRenderer):
+    """Renderer of a node with nested bodies.
+
+    The bodies stay fragment lists spliced into the node's own template
+    output, so deep nesting does not copy them once per level. They are
+    not rendered by nested calls: iter_fragments() yields the render
+    requests of its bodies to the builder, which answers them from an
+    explicit stack.
+    """
+
+    @abstractmethod
+    def iter_fragments(self, *args, **kwargs) -> RenderRequests:
+        """Generator of render requests returning the node's fragment list."""
+        pass
+
+    def render_fragments(self, *args, **kwargs) -> list:
+        return self._ancestor.run_renderer(
+            self, kwargs.get("tabs", ""), kwargs.get("with_buttons", True)
+        )
+
+    def render_html(self, *args, **kwargs) -> str:
+        return join_fragments(self.render_fragments(*args, **kwargs))
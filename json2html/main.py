@@ -1,45 +1,90 @@
 import argparse
-from builder import JSON2HtmlBuilder
-import json
 import os
+import sys
 from pathlib import Path
 
+from .builder import JSON2HtmlBuilder
+from .cache import FragmentCache
+from .instrumentation import RenderStats
+
 argument_parser = argparse.ArgumentParser(
     description="Compile JSON tree of code to HTML"
 )
 argument_parser.add_argument("lang", help="Programming language for target HTML")
-argument_parser.add_argument("input", help="Algorithm JSON tree file")
+argument_parser.add_argument("input", help="Algorithm tree file (JSON or the compact format)")
 argument_parser.add_argument(
     "--disable-buttons",
     help="Disables action buttons in HTML",
     action="store_true",
     default=False,
 )
+argument_parser.add_argument(
+    "-o",
+    "--output",
+    help="Write HTML to this file ('-' for stdout) instead of next to the input",
+)
+argument_parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=1,
+    help="Render functions in this many worker processes",
+)
+argument_parser.add_argument(
+    "--bytecode-cache",
+    help="Directory to keep compiled templates in between runs",
+)
+argument_parser.add_argument(
+    "--fragment-cache",
+    help="Directory to keep rendered functions in, so that unchanged ones are not rendered again",
+)
+argument_parser.add_argument(
+    "--stats",
+    help="Write render statistics (node counts, render time, template cache hits) to this JSON file",
+)
 
 
 def main():
-    default_cmd_args = ['c', "examples/example8.json"]
-    # default_cmd_args = ['python', "../examples/example2.json"]
-    args = argument_parser.parse_args(default_cmd_args)
-    
+    args = argument_parser.parse_args()
+
     with open(args.input, "rb") as fobj:
         data = fobj.read()
-        
-    obj = json.loads(data)
-    builder = JSON2HtmlBuilder(args.lang)
+
     directory = os.path.dirname(__file__)
     if not os.path.isdir(os.path.join(directory, "templates", args.lang)):
         print("Unsupported programming language")
         return
-    
-    html = builder.build(obj, with_buttons=not args.disable_buttons)
-    # print(html)
-    print(len(html), 'bytes of HTML done.')
-
-    out_p = Path(args.input)
-    out_p = out_p.with_suffix('.html')
-    with out_p.open('w') as f:
-        f.write(html + '\n')
+
+    stats = RenderStats() if args.stats else None
+    fragment_cache = None
+    if args.fragment_cache:
+        fragment_cache = FragmentCache(directory=args.fragment_cache)
+    with JSON2HtmlBuilder(
+        args.lang,
+        instrumentation=stats,
+        bytecode_cache=args.bytecode_cache,
+        fragment_cache=fragment_cache,
+        jobs=args.jobs,
+    ) as builder:
+        # the document is written while it is rendered, function by function
+        chunks = builder.iter_build(data, with_buttons=not args.disable_buttons)
+        size = 0
+        if args.output == "-":
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+                size += len(chunk)
+            sys.stdout.write("\n")
+        else:
+            out_p = Path(args.output) if args.output else Path(args.input).with_suffix('.html')
+            with out_p.open('w', encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                f.write('\n')
+    print(size, 'bytes of HTML done.', file=sys.stderr if args.output == "-" else sys.stdout)
+    if stats is not None:
+        with open(args.stats, "w") as f:
+            f.write(stats.to_json(indent=1) + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+"""Rendering of top-level functions over a process pool.
+
+Functions start at Tab(0) and do not depend on each other, so they can be
+rendered in any process. Every worker creates its own builder once and
+renders chunks of functions to finished HTML strings; the parent yields
+them back in document order, so the output is byte-for-byte the serial
+one. Only a bounded number of chunks is in flight at a time, which keeps
+streaming output streaming.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from .utils import Tab
+
+_worker = {}
+
+
+def _init_worker(lang, bytecode_cache):
+    from .builder import JSON2HtmlBuilder
+
+    _worker["builder"] = JSON2HtmlBuilder(lang, bytecode_cache=bytecode_cache)
+
+
+def make_executor(lang: str, jobs: int, bytecode_cache: Optional[str] = None) -> ProcessPoolExecutor:
+    """Pool of ``jobs`` processes with a builder for ``lang`` each."""
+    return ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(lang, bytecode_cache)
+    )
+
+
+def _render_functions(nodes: List[dict], with_buttons: bool) -> List[Optional[str]]:
+    builder = _worker["builder"]
+    return [builder.render_top_level(node, with_buttons) for node in nodes]
+
+
+def render_functions(
+    executor,
+    nodes: Iterable[dict],
+    count: int,
+    with_buttons: bool,
+    jobs: int,
+    lang: str,
+    cache=None,
+) -> Iterator[Optional[str]]:
+    """Yield the HTML of every function (None if it has no renderer) in order.
+
+    ``nodes`` may be a lazy iterable of ``count`` functions; it is consumed
+    one chunk at a time. Functions found in the fragment ``cache`` are not
+    sent to the workers, the others are put into it as they come back.
+    """
+    chunksize = max(1, min(64, count // (jobs * 4)))
+    nodes = iter(nodes)
+    pending = deque()
+
+    def finish():
+        results, keys, missing, future = pending.popleft()
+        if future is not None:
+            for index, html in zip(missing, future.result()):
+                results[index] = html
+                if cache is not None and html is not None:
+                    cache.put(keys[index], html)
+        return results
+
+    while chunk := list(islice(nodes, chunksize)):
+        results = [None] * len(chunk)
+        keys = [None] * len(chunk)
+        missing = []
+        for index, node in enumerate(chunk):
+            if cache is not None:
+                keys[index] = cache.key(node, lang, Tab(0), with_buttons)
+                results[index] = cache.get(keys[index])
+            if results[index] is None:
+                missing.append(index)
+        future = None
+        if missing:
+            future = executor.submit(
+                _render_functions, [chunk[index] for index in missing], with_buttons
+            )
+        pending.append((results, keys, missing, future))
+        if len(pending) > jobs * 2:
+            yield from finish()
+    while pending:
+        yield from finish()
@@ -9,6 +9,14 @@ class Tab:
         self._whitespaces = whitespaces
         self._level = level
 
+    @property
+    def level(self) -> int:
+        return self._level
+
+    @property
+    def whitespaces(self) -> int:
+        return self._whitespaces
+
     def up(self):
         return Tab(self._level + 1, self._whitespaces)
 
@@ -30,3 +38,59 @@ class Tab:
 
 def html_quote_escape(string):
     return string.replace('"', "&quot;").replace("'", "&#39;")
+
+
+def iter_fragments(fragments):
+    """Yield the strings of a nested fragment list in document order."""
+    stack = [iter(fragments)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            yield item
+        else:
+            stack.pop()
+
+
+def join_fragments(fragments) -> str:
+    return "".join(iter_fragments(fragments))
+
+
+class Fragments:
+    """Rendered subtrees handed to a parent template as placeholders.
+
+    The template renders a short marker instead of the subtree HTML and
+    splice() swaps the markers in its output for the fragment lists, so a
+    subtree is never copied into the string of its parent. The result is a
+    nested fragment list that is joined once, at the top.
+    """
+
+    def __init__(self, marker: str):
+        self._marker = marker
+        self._parts = []
+
+    def add(self, fragments: list) -> str:
+        if not fragments:
+            # templates test bodies for emptiness (e.g. to emit `pass`)
+            return ""
+        self._parts.append(fragments)
+        return "%s%d%s" % (self._marker, len(self._parts) - 1, self._marker)
+
+    def defer(self, fragments) -> str:
+        """Add an iterable of fragment lists that the caller consumes lazily."""
+        self._parts.append(fragments)
+        return "%s%d%s" % (self._marker, len(self._parts) - 1, self._marker)
+
+    def splice(self, html: str, release: bool = False) -> list:
+        """Replace the markers in html; ``release`` drops the spliced
+        subtrees, for a caller that splices chunks of a streamed template."""
+        if not self._parts:
+            return [html]
+        pieces = html.split(self._marker)
+        for i in range(1, len(pieces), 2):
+            index = int(pieces[i])
+            pieces[i] = self._parts[index]
+            if release:
+                self._parts[index] = None
+        return pieces